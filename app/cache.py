@@ -0,0 +1,677 @@
+"""
+Caching of serialized reads, shared by every worker process when backed by a
+Redis-protocol server.
+
+A `Cache` is a named set of entries (the challenge list pages, the profiles)
+stored in the configured `CacheBackend`. Each entry carries tags, such as
+`user:42`, and invalidating a tag drops every entry carrying it, whatever cache
+it belongs to. Values are bytes, so serialized responses are stored as sent.
+
+Reads racing with a write are guarded against: `get` returns the versions of
+the entry's tags along with the value, and `set` only stores a value built from
+the database if none of those tags was invalidated in between.
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+from fastapi import Request, Response
+
+from app.compression import accepts_gzip, compressed_response, decompressed_response
+from app.conditional import Validators, is_not_modified, not_modified
+from app.config import settings
+from app.pagination import NEXT_PAGE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """
+    Raised when the cache server fails or answers with an error.
+    """
+
+
+class CacheBackend(ABC):
+    """
+    Storage of tagged byte values with a time to live.
+    """
+
+    @abstractmethod
+    async def get(self, key: str, tags: Sequence[str]) -> Tuple[Optional[bytes], Tuple]:
+        """
+        Look up a value.
+
+        Args:
+            key (str): The entry's key.
+            tags (Sequence[str]): The entry's tags.
+
+        Returns:
+            Tuple[Optional[bytes], Tuple]: The value, or None if missing, expired or
+                invalidated, and the current versions of the tags, to pass to `set`.
+        """
+
+    @abstractmethod
+    async def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Sequence[str],
+        versions: Tuple,
+    ) -> None:
+        """
+        Store a value, unless one of its tags was invalidated since `versions`
+        were read.
+
+        Args:
+            key (str): The entry's key.
+            value (bytes): The value.
+            ttl (float): Seconds the entry may be served.
+            tags (Sequence[str]): The entry's tags.
+            versions (Tuple): Tag versions returned by the `get` that missed.
+        """
+
+    @abstractmethod
+    async def invalidate(self, tags: Sequence[str]) -> None:
+        """
+        Drop every entry carrying one of the tags.
+
+        Args:
+            tags (Sequence[str]): The tags.
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """
+        Report the backend's state.
+
+        Returns:
+            Dict: Backend-specific figures.
+        """
+
+
+class NullBackend(CacheBackend):
+    """
+    Backend storing nothing, every read missing.
+    """
+
+    async def get(self, key: str, tags: Sequence[str]) -> Tuple[Optional[bytes], Tuple]:
+        return None, ()
+
+    async def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Sequence[str],
+        versions: Tuple,
+    ) -> None:
+        pass
+
+    async def invalidate(self, tags: Sequence[str]) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": "none"}
+
+
+class _MemoryEntry(NamedTuple):
+    value: bytes
+    tags: Tuple[str, ...]
+    expires_at: float
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU backend, bounded by the total size of the values it holds.
+
+    Entries expire after their TTL, which also bounds how long a write made by
+    another process goes unnoticed. Like on the cache server, each tag has a
+    version bumped by its invalidation, so a value read before it is not stored,
+    while values tagged for other users are. Only used from the event loop, so no
+    locking is needed.
+
+    Attributes:
+        max_bytes (int): Most bytes of values kept.
+        tag_ttl (float): Seconds a tag's version is remembered after its last
+            invalidation, longer than any read takes.
+        evictions (int): Entries evicted to stay within `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, tag_ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.tag_ttl = tag_ttl
+        self.evictions = 0
+        self._entries: "OrderedDict[str, _MemoryEntry]" = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        # Version of each invalidated tag, from a counter shared by all tags so a
+        # forgotten tag never comes back with a version seen before
+        self._tag_versions: Dict[str, Tuple[int, float]] = {}
+        self._invalidations = itertools.count(1)
+        self._bytes = 0
+
+    def _versions(self, tags: Sequence[str]) -> Tuple:
+        return tuple(self._tag_versions.get(tag, (0, 0.0))[0] for tag in tags)
+
+    async def get(self, key: str, tags: Sequence[str]) -> Tuple[Optional[bytes], Tuple]:
+        versions = self._versions(tags)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, versions
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None, versions
+        self._entries.move_to_end(key)
+        return entry.value, versions
+
+    async def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Sequence[str],
+        versions: Tuple,
+    ) -> None:
+        if versions != self._versions(tags) or len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = _MemoryEntry(value, tuple(tags), time.monotonic() + ttl)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def invalidate(self, tags: Sequence[str]) -> None:
+        now = time.monotonic()
+        if len(self._tag_versions) >= 10000:
+            # Forget tags invalidated long ago, keeping the map bounded
+            self._tag_versions = {
+                tag: version
+                for tag, version in self._tag_versions.items()
+                if version[1] > now - self.tag_ttl
+            }
+        for tag in tags:
+            self._tag_versions[tag] = (next(self._invalidations), now)
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.value)
+        for tag in entry.tags:
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "tags": len(self._keys_by_tag),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class _RespConnection:
+    """
+    One connection speaking the Redis serialization protocol (RESP).
+    """
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """
+        Send the commands in one write and read their replies.
+
+        Raises:
+            CacheError: If a command failed, once every reply has been read.
+        """
+        self.writer.write(b"".join(self._encode(command) for command in commands))
+        await self.writer.drain()
+        replies = [await self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, CacheError):
+                raise reply
+        return replies
+
+    @staticmethod
+    def _encode(command: Sequence[Any]) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Cache server closed the connection")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return CacheError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line!r}")
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend on a Redis-protocol server, shared by every worker process.
+
+    Tags are version counters: invalidating a tag increments its counter, and
+    each value is stored along with the versions of its tags at the time it was
+    read. A lookup fetches the value and the current versions with one `MGET`, a
+    value stored under older versions counting as a miss. Invalidation is thus
+    O(1) whatever the number of entries, which are left to expire. A counter
+    lives `tag_ttl` seconds after its last use, longer than any entry carrying it.
+
+    Every command is bounded by `timeout`, so a failing server makes reads miss
+    rather than hang the request.
+
+    Attributes:
+        url (str): `redis://[:password@]host[:port][/db]` of the server.
+        pool_size (int): Most connections open at once.
+        timeout (float): Seconds a command may take.
+        errors (int): Commands that failed.
+    """
+
+    def __init__(
+        self, url: str, pool_size: int, timeout: float, tag_ttl: float
+    ) -> None:
+        parsed = urlsplit(url)
+        self.url = url
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._tag_ttl_ms = int(tag_ttl * 1000)
+        self._idle: List[_RespConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.errors = 0
+
+    async def _connect(self) -> _RespConnection:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        connection = _RespConnection(reader, writer)
+        setup = []
+        if self._password is not None:
+            setup.append(("AUTH", self._password))
+        if self._db:
+            setup.append(("SELECT", self._db))
+        if setup:
+            await connection.pipeline(setup)
+        return connection
+
+    async def execute(self, *commands: Sequence[Any]) -> List[Any]:
+        """
+        Run commands as one pipeline on a pooled connection.
+
+        Args:
+            *commands (Sequence[Any]): Commands, e.g. `("GET", "key")`.
+
+        Returns:
+            List[Any]: One reply per command.
+
+        Raises:
+            CacheError: If the server cannot be reached in time or a command failed.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(
+                    connection.pipeline(commands), self.timeout
+                )
+            except CacheError:
+                # An error reply, the connection is still in a known state
+                self.errors += 1
+                self._idle.append(connection)
+                raise
+            except (OSError, EOFError, asyncio.TimeoutError) as error:
+                self.errors += 1
+                if connection is not None:
+                    connection.close()
+                raise CacheError(f"Cache server unavailable: {error!r}") from error
+            except BaseException:
+                # Cancelled halfway through, the connection cannot be reused
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+            return replies
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}tag:{tag}"
+
+    async def get(self, key: str, tags: Sequence[str]) -> Tuple[Optional[bytes], Tuple]:
+        (replies,) = await self.execute(
+            ("MGET", key, *[self._tag_key(tag) for tag in tags])
+        )
+        stored, *current = replies
+        versions = tuple(int(version or 0) for version in current)
+        if stored is None:
+            return None, versions
+        stored_versions, _, value = stored.partition(b"\n")
+        if stored_versions != _encode_versions(versions):
+            return None, versions  # A tag was invalidated since it was stored
+        return value, versions
+
+    async def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        tags: Sequence[str],
+        versions: Tuple,
+    ) -> None:
+        # Stored under the versions read before the database was, so a concurrent
+        # invalidation makes the value stale instead of being lost
+        envelope = _encode_versions(versions) + b"\n" + value
+        await self.execute(
+            ("SET", key, envelope, "PX", max(int(ttl * 1000), 1)),
+            *[("PEXPIRE", self._tag_key(tag), self._tag_ttl_ms) for tag in tags],
+        )
+
+    async def invalidate(self, tags: Sequence[str]) -> None:
+        commands = []
+        for tag in tags:
+            commands.append(("INCR", self._tag_key(tag)))
+            commands.append(("PEXPIRE", self._tag_key(tag), self._tag_ttl_ms))
+        await self.execute(*commands)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": "redis",
+            "host": self._host,
+            "port": self._port,
+            "db": self._db,
+            "pool_size": self.pool_size,
+            "idle_connections": len(self._idle),
+            "errors": self.errors,
+        }
+
+
+def _encode_versions(versions: Tuple) -> bytes:
+    return ",".join(str(version) for version in versions).encode("ascii")
+
+
+def create_backend(name: str) -> CacheBackend:
+    """
+    Build the backend selected by CACHE_BACKEND.
+
+    Args:
+        name (str): `memory`, `redis` or `none`.
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if name == "memory":
+        return MemoryBackend(settings.CACHE_MAX_BYTES, settings.CACHE_TAG_TTL)
+    if name == "redis":
+        return RedisBackend(
+            settings.CACHE_URL,
+            settings.CACHE_POOL_SIZE,
+            settings.CACHE_TIMEOUT,
+            settings.CACHE_TAG_TTL,
+        )
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+backend = create_backend(settings.CACHE_BACKEND)
+
+
+class CacheLookup(NamedTuple):
+    """
+    Result of `Cache.get`.
+
+    Attributes:
+        value (Optional[bytes]): The cached value, None on a miss.
+        versions (Optional[Tuple]): Versions of the entry's tags, passed back to
+            `Cache.put`. None if the lookup failed.
+    """
+
+    value: Optional[bytes]
+    versions: Optional[Tuple]
+
+
+class Cache:
+    """
+    A named set of entries in the shared `backend`, with their time to live and
+    hit counters. Cache errors are logged and count as misses.
+
+    Attributes:
+        name (str): Label of the cache, also the namespace of its keys.
+        ttl (float): Seconds an entry may be served.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that were not.
+    """
+
+    def __init__(self, name: str, ttl: float) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}{self.name}:{key}"
+
+    async def get(self, key: str, tags: Sequence[str]) -> CacheLookup:
+        """
+        Look up an entry.
+
+        Args:
+            key (str): The entry's key within this cache.
+            tags (Sequence[str]): The entry's tags.
+
+        Returns:
+            CacheLookup: The value, if cached, and the versions to pass to `put`.
+        """
+        try:
+            value, versions = await backend.get(self._key(key), tags)
+        except CacheError:
+            logger.warning("Lookup in the %s cache failed", self.name, exc_info=True)
+            value, versions = None, None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return CacheLookup(value, versions)
+
+    async def put(
+        self, key: str, tags: Sequence[str], value: bytes, versions: Optional[Tuple]
+    ) -> None:
+        """
+        Store an entry built after a missed `get`.
+
+        Args:
+            key (str): The entry's key within this cache.
+            tags (Sequence[str]): The entry's tags.
+            value (bytes): The value.
+            versions (Optional[Tuple]): `CacheLookup.versions` of the missed lookup.
+        """
+        if versions is None:
+            return  # The lookup failed, whether the value is current is unknown
+        try:
+            await backend.set(self._key(key), value, self.ttl, tags, versions)
+        except CacheError:
+            logger.warning("Store in the %s cache failed", self.name, exc_info=True)
+
+    def stats(self) -> Dict:
+        """
+        Report the cache's effectiveness.
+
+        Returns:
+            Dict: Time to live, hits, misses and hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+async def invalidate(*tags: str) -> None:
+    """
+    Drop the entries carrying any of the tags, in every cache. Call once the write
+    has committed.
+
+    Args:
+        *tags (str): The tags, e.g. `user_tag(42)`.
+    """
+    try:
+        await backend.invalidate(tags)
+    except CacheError:
+        # Entries still expire after their TTL, which bounds how stale they get
+        logger.error("Invalidating the cache tags %s failed", tags, exc_info=True)
+
+
+def user_tag(user_id: int, *scope: str) -> str:
+    """
+    Tag of a user's cached data, or of a part of it.
+
+    Args:
+        user_id (int): Unique identifier of the user.
+        *scope (str): Narrower scope, e.g. `challenges`.
+
+    Returns:
+        str: E.g. `user:42` or `user:42:challenges`.
+    """
+    return ":".join(["user", str(user_id), *scope])
+
+
+# Response headers stored along with a cached response body
+CACHED_HEADERS = (
+    "content-type",
+    "content-encoding",
+    "vary",
+    "etag",
+    "last-modified",
+    *(name.lower() for name in NEXT_PAGE_HEADERS),
+)
+
+
+def _pack_response(response: Response) -> bytes:
+    headers = {
+        name: response.headers[name]
+        for name in CACHED_HEADERS
+        if name in response.headers
+    }
+    return json.dumps(headers).encode("utf-8") + b"\n" + response.body
+
+
+def _unpack_response(value: bytes) -> Response:
+    headers, _, body = value.partition(b"\n")
+    return Response(body, headers=json.loads(headers))
+
+
+def _negotiate(request: Request, response: Response) -> Response:
+    # Entries stored gzipped are only decompressed for clients not accepting it
+    if accepts_gzip(request.headers.get("accept-encoding")):
+        return response
+    return decompressed_response(response)
+
+
+def cached_read(
+    cache: Cache, tags: Callable[..., List[str]], compress: bool = False
+) -> Callable:
+    """
+    Declare the responses of a GET endpoint cacheable.
+
+    The endpoint must take a `request: Request` parameter and return a
+    `Response`. Its 200 responses are stored in `cache` with their
+    `CACHED_HEADERS`, keyed by their URL and first tag. A hit is sent without
+    calling the endpoint, or answered with a 304 if the request's validators
+    match the cached ones.
+
+    Args:
+        cache (Cache): Cache receiving the responses.
+        tags (Callable[..., List[str]]): Called with the endpoint's arguments,
+            returns the tags of the response, the first one naming whose data it
+            is (e.g. `user_tag(current_user.id)`).
+        compress (bool, optional): Store the responses gzipped, when at least
+            COMPRESSION_MIN_SIZE bytes, so that hits are not compressed again.
+
+    Returns:
+        Callable: Decorator for the endpoint, to apply below the route decorator.
+    """
+
+    def decorator(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def wrapper(**kwargs: Any) -> Response:
+            request: Request = kwargs["request"]
+            entry_tags = tags(**kwargs)
+            key = f"{entry_tags[0]}:{request.url.path}?{request.url.query}"
+
+            lookup = await cache.get(key, entry_tags)
+            if lookup.value is not None:
+                response = _unpack_response(lookup.value)
+                if "etag" in response.headers:
+                    validators = Validators.from_headers(response.headers)
+                    if is_not_modified(request, validators):
+                        return not_modified(validators)
+                return _negotiate(request, response)
+
+            response = await endpoint(**kwargs)
+            if response.status_code == 200:
+                if compress:
+                    response = compressed_response(response)
+                await cache.put(
+                    key, entry_tags, _pack_response(response), lookup.versions
+                )
+            return _negotiate(request, response)
+
+        return wrapper
+
+    return decorator
+
+
+# Pages of each user's challenge list, as sent by GET /challenges/all_challenges
+challenge_list_cache = Cache("challenge_list", settings.CHALLENGE_LIST_CACHE_TTL)
+# Each user's profile, as sent by GET /users/profile
+profile_cache = Cache("profile", settings.PROFILE_CACHE_TTL)
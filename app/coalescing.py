@@ -0,0 +1,159 @@
+"""
+Coalescing of identical concurrent reads ("singleflight").
+
+While a read is in flight, an identical one, same route, principal, parameters
+and conditional headers, waits for its result instead of running its own
+queries. Nothing is kept once the read completes: this only merges overlapping
+requests, caching is `app.cache`'s job.
+
+Users who wrote within READ_YOUR_WRITES_SECONDS are not coalesced: a read in
+flight may have started before their write, and must not answer for a read made
+after it.
+"""
+
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from fastapi import Request, Response
+
+from app import database
+from app.schemas import TokenData
+
+# Request headers changing the response of a read, and so part of its key
+VARYING_HEADERS = ("if-none-match",)
+
+
+class SingleFlight:
+    """
+    Registry of the reads in flight for one endpoint.
+
+    Each read runs in its own task, which every caller awaits shielded: a caller
+    cancelled, e.g. by a client disconnecting, does not cancel the read for the
+    others. Only used from the event loop, so no locking is needed.
+
+    Attributes:
+        name (str): Label of the endpoint in stats.
+        leaders (int): Reads that ran.
+        followers (int): Reads that waited for an identical one instead.
+        bypassed (int): Reads run uncoalesced, their user having just written.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self.bypassed = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, read: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a read, or join the identical one in flight.
+
+        Args:
+            key (Hashable): Identifies the read.
+            read (Callable[[], Awaitable[Any]]): Performs the read, only called when
+                no identical read is in flight.
+
+        Returns:
+            Any: The read's result, shared with every caller that joined it.
+
+        Raises:
+            Exception: Whatever the read raised, for every caller that joined it.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(read())
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._finish, key))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller was cancelled
+
+    def stats(self) -> Dict:
+        """
+        Report how many reads were coalesced.
+
+        Returns:
+            Dict: Reads run, joined and bypassed, the share joined, and reads in
+                flight.
+        """
+        reads = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "bypassed": self.bypassed,
+            "coalesced_ratio": self.followers / reads if reads else 0.0,
+            "in_flight": len(self._in_flight),
+        }
+
+
+def request_key(request: Request, current_user: TokenData) -> Tuple:
+    """
+    Key of a read: its principal, path, query string and `VARYING_HEADERS`.
+
+    Args:
+        request (Request): The request.
+        current_user (TokenData): The authenticated user.
+
+    Returns:
+        Tuple: The key.
+    """
+    return (
+        current_user.id,
+        request.url.path,
+        request.url.query,
+        *(request.headers.get(name) for name in VARYING_HEADERS),
+    )
+
+
+def _copy(response: Response) -> Response:
+    # Each request sends its own response object, sharing the serialized body
+    return Response(
+        response.body, status_code=response.status_code, headers=response.headers
+    )
+
+
+def coalesced(flight: SingleFlight) -> Callable:
+    """
+    Coalesce identical concurrent calls of a GET endpoint.
+
+    The endpoint must take `request: Request` and `current_user: TokenData`
+    parameters and return a serialized `Response`, which is what gets shared. It
+    should open its session itself, so that the calls that join another open none.
+    Calls by a user who wrote recently run on their own, neither joining nor
+    being joined.
+
+    Args:
+        flight (SingleFlight): Registry of the endpoint's reads in flight.
+
+    Returns:
+        Callable: Decorator for the endpoint, to apply below the route decorator.
+    """
+
+    def decorator(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def wrapper(**kwargs: Any) -> Response:
+            current_user = kwargs["current_user"]
+            if await database.recent_writers.is_recent(current_user.id):
+                flight.bypassed += 1
+                return await endpoint(**kwargs)
+            key = request_key(kwargs["request"], current_user)
+            response = await flight.run(key, lambda: endpoint(**kwargs))
+            return _copy(response)
+
+        return wrapper
+
+    return decorator
+
+
+challenge_list_flight = SingleFlight("challenge_list")
+log_list_flight = SingleFlight("log_list")
+shared_inbox_flight = SingleFlight("shared_inbox")
@@ -0,0 +1,137 @@
+"""
+gzip compression of responses, negotiated through `Accept-Encoding`.
+
+`CompressionMiddleware` compresses every response of at least
+COMPRESSION_MIN_SIZE bytes. Streaming responses are compressed chunk by chunk
+as they are sent, never buffered whole. Responses already carrying a
+`Content-Encoding`, such as those cached in compressed form by
+`app.cache.cached_read`, are sent as they are.
+"""
+
+import gzip
+from typing import Optional
+
+from fastapi import Response
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Tell whether an `Accept-Encoding` header allows a gzip response.
+
+    Args:
+        accept_encoding (Optional[str]): The request's header, if any.
+
+    Returns:
+        bool: True if `gzip` (or `*`) is listed with a non-zero quality.
+    """
+    if not accept_encoding:
+        return False
+    accepted = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted.get("gzip", accepted.get("*", 0.0)) > 0
+
+
+def compress(body: bytes) -> bytes:
+    """
+    gzip a whole body at COMPRESSION_LEVEL.
+
+    Args:
+        body (bytes): The body.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_LEVEL)
+
+
+def compressed_response(response: Response) -> Response:
+    """
+    Copy a response with its body gzipped, unless it is below
+    COMPRESSION_MIN_SIZE or already encoded.
+
+    Args:
+        response (Response): A response with its whole body.
+
+    Returns:
+        Response: The compressed copy, or `response` itself.
+    """
+    if (
+        len(response.body) < settings.COMPRESSION_MIN_SIZE
+        or "content-encoding" in response.headers
+    ):
+        return response
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name != "content-length"
+    }
+    headers["Content-Encoding"] = "gzip"
+    compressed = Response(
+        compress(response.body), status_code=response.status_code, headers=headers
+    )
+    compressed.headers.add_vary_header("Accept-Encoding")
+    return compressed
+
+
+def decompressed_response(response: Response) -> Response:
+    """
+    Copy a gzipped response with its body decompressed, for a client that does
+    not accept gzip.
+
+    Args:
+        response (Response): A response, possibly gzipped.
+
+    Returns:
+        Response: The decompressed copy, or `response` itself if not gzipped.
+    """
+    if response.headers.get("content-encoding") != "gzip":
+        return response
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-encoding", "content-length")
+    }
+    return Response(
+        gzip.decompress(response.body),
+        status_code=response.status_code,
+        headers=headers,
+    )
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Starlette's gzip middleware, with `Accept-Encoding` qualities honoured and
+    its thresholds taken from the settings.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        super().__init__(
+            app,
+            minimum_size=settings.COMPRESSION_MIN_SIZE,
+            compresslevel=settings.COMPRESSION_LEVEL,
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and accepts_gzip(
+            Headers(scope=scope).get("accept-encoding")
+        ):
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
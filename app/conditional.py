@@ -0,0 +1,128 @@
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi import Request, Response, status
+
+
+@dataclass(frozen=True)
+class Validators:
+    """
+    HTTP validators of a list response, derived from cheap aggregates of the rows
+    it is built from rather than from the response body.
+
+    Timestamps have one-second resolution, as in `Last-Modified` itself, so the
+    ETag is weak: two changes within the same second that leave the aggregates
+    unchanged may go unnoticed until the next change.
+
+    `Last-Modified` is informational only: deleting a row other than the latest
+    leaves it unchanged, so conditional requests are answered from the ETag alone.
+
+    Attributes:
+        etag (str): Weak entity tag, quoted.
+        last_modified (Optional[datetime]): Latest change among the rows, None if
+            there are none.
+    """
+
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    @classmethod
+    def from_headers(cls, headers: Dict[str, str]) -> "Validators":
+        """
+        Read back the validators of a response stored with its headers.
+
+        Args:
+            headers (Dict[str, str]): Headers produced by `headers()`, possibly
+                among others.
+
+        Returns:
+            Validators: The validators.
+        """
+        last_modified = headers.get("Last-Modified")
+        return cls(
+            etag=headers["ETag"],
+            last_modified=(
+                parsedate_to_datetime(last_modified) if last_modified else None
+            ),
+        )
+
+    def headers(self) -> Dict[str, str]:
+        """
+        Render the validators as response headers.
+
+        Returns:
+            Dict[str, str]: `ETag`, and `Last-Modified` when known.
+        """
+        headers = {"ETag": self.etag}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.astimezone(timezone.utc), usegmt=True
+            )
+        return headers
+
+
+def make_validators(
+    request: Request, aggregates: Sequence[Any], last_modified: Optional[datetime]
+) -> Validators:
+    """
+    Derive the validators of a list response.
+
+    Args:
+        request (Request): The request, whose path and query string (page, filters)
+            are part of the ETag.
+        aggregates (Sequence[Any]): Values changing whenever the listed rows do,
+            e.g. their count, highest id and latest change.
+        last_modified (Optional[datetime]): Latest change among the rows.
+
+    Returns:
+        Validators: The ETag and `Last-Modified` of the response.
+    """
+    key = repr((request.url.path, request.url.query, tuple(aggregates)))
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+    return Validators(etag=f'W/"{digest}"', last_modified=last_modified)
+
+
+def is_not_modified(request: Request, validators: Validators) -> bool:
+    """
+    Evaluate the request's `If-None-Match` against the current validators.
+
+    `If-Modified-Since` is ignored, as the HTTP spec allows: `Last-Modified` does
+    not move when a row other than the latest is deleted, and has one-second
+    resolution, so it could confirm a stale copy. The ETag covers both, through
+    the row count and highest id it is derived from.
+
+    Args:
+        request (Request): The conditional request.
+        validators (Validators): Validators of the current response.
+
+    Returns:
+        bool: True if the client's copy is current and a 304 may be sent.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    current = validators.etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == current for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(validators: Validators) -> Response:
+    """
+    Build the empty `304 Not Modified` response.
+
+    Args:
+        validators (Validators): Validators of the current response.
+
+    Returns:
+        Response: The 304, repeating the validators.
+    """
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=validators.headers()
+    )
@@ -0,0 +1,1163 @@
+from datetime import date, datetime, time, timedelta
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from sqlalchemy import (
+    Select,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql import ColumnElement
+
+from app import cache, database, pagination, schemas, utils
+from app.config import settings
+from app.revocation import revocations
+
+# MySQL error code for a duplicate key
+ER_DUP_ENTRY = 1062
+
+
+def dialect_name(db: database.DBSession) -> str:
+    """
+    Name of the SQL dialect the session talks to.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+
+    Returns:
+        str: `mysql`, `sqlite`, `postgresql`, ...
+    """
+    return db.get_bind().dialect.name
+
+
+def is_duplicate_key(error: IntegrityError) -> bool:
+    """
+    Tell a unique-key violation apart from other integrity errors (e.g. foreign keys).
+
+    Args:
+        error (IntegrityError): Error raised by the DBAPI.
+
+    Returns:
+        bool: True if the error was caused by a duplicate key.
+    """
+    code = error.orig.args[0] if error.orig is not None and error.orig.args else None
+    return code == ER_DUP_ENTRY or "UNIQUE constraint failed" in str(error.orig)
+
+
+def log_datetime(log_date: date) -> datetime:
+    """
+    Convert a log day into the value stored in the `log_date` DateTime column.
+
+    Comparing the column with a plain `date` binds it as a DATE, which does not
+    match the stored midnight timestamps on every backend.
+
+    Args:
+        log_date (date): Day of a log, as received from the client.
+
+    Returns:
+        datetime: Midnight of that day.
+    """
+    if isinstance(log_date, datetime):
+        return log_date
+    return datetime.combine(log_date, time.min)
+
+
+async def _add_unique(db: database.DBSession, instance: object) -> bool:
+    """
+    Add and commit a new row, reporting a unique-key clash instead of raising.
+    """
+    db.add(instance)
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if not is_duplicate_key(error):
+            raise
+        return False
+    return True
+
+
+# Users
+
+
+async def get_user(db: database.DBSession, user_id: int) -> Optional[database.User]:
+    """
+    Fetch a user by ID.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): Unique identifier of the user.
+
+    Returns:
+        Optional[database.User]: The user, or None if it does not exist.
+    """
+    return await db.get(database.User, user_id)
+
+
+async def get_user_by_username(
+    db: database.DBSession, username: str
+) -> Optional[database.User]:
+    """
+    Fetch a user by username.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        username (str): Username to look up.
+
+    Returns:
+        Optional[database.User]: The user, or None if it does not exist.
+    """
+    return await db.scalar(
+        select(database.User).where(database.User.username == username)
+    )
+
+
+async def user_exists(db: database.DBSession, username: str, email: str) -> bool:
+    """
+    Check whether a username or email is already taken.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        username (str): Username to check.
+        email (str): Email to check.
+
+    Returns:
+        bool: True if a user has this username or email.
+    """
+    return await db.scalar(
+        select(
+            exists().where(
+                (database.User.username == username) | (database.User.email == email)
+            )
+        )
+    )
+
+
+async def create_user(db: database.DBSession, user: database.User) -> bool:
+    """
+    Insert a user, the unique username and email indexes catching a concurrent
+    registration that passed `user_exists`. Commits on success.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user (database.User): The new user.
+
+    Returns:
+        bool: False if the username or email is already taken.
+    """
+    return await _add_unique(db, user)
+
+
+async def update_password_hash(
+    db: database.DBSession, user_id: int, password_hash: str
+) -> None:
+    """
+    Replace a user's password hash. Commits, and drops the user's cached profile.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): Unique identifier of the user.
+        password_hash (str): The new hash.
+    """
+    await db.execute(
+        update(database.User)
+        .where(database.User.id == user_id)
+        .values(password_hash=password_hash)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await cache.invalidate(cache.user_tag(user_id, "profile"))
+
+
+def _token_lifetime() -> timedelta:
+    # Lifetime of the tokens issued at login and refresh
+    return timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+
+def _user_cutoff(user_id: int) -> database.RevokedToken:
+    # On the clock of the tokens' claims: the row outlives the `exp` of every
+    # token issued before the cutoff
+    now = utils.token_timestamp()
+    return database.RevokedToken(
+        user_id=user_id,
+        issued_before_ms=int(now * 1000),
+        expires_at=database.timestamp_at(utils.token_expiry(now, _token_lifetime())),
+    )
+
+
+async def change_password(
+    db: database.DBSession, user_id: int, password_hash: str
+) -> None:
+    """
+    Replace a user's password hash and revoke every token issued to the user so
+    far, in one transaction. Commits, and drops the user's cached profile.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): Unique identifier of the user.
+        password_hash (str): The new hash.
+    """
+    cutoff = _user_cutoff(user_id)
+    await db.execute(
+        update(database.User)
+        .where(database.User.id == user_id)
+        .values(password_hash=password_hash)
+        .execution_options(synchronize_session=False)
+    )
+    db.add(cutoff)
+    await db.commit()
+    await cache.invalidate(cache.user_tag(user_id, "profile"))
+    revocations.apply([cutoff])
+
+
+async def revoke_token(db: database.DBSession, principal: schemas.TokenData) -> None:
+    """
+    Revoke a single token, e.g. on logout. Commits, and applies the revocation to
+    this process at once.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        principal (schemas.TokenData): The verified token.
+    """
+    if principal.jti is None:
+        # Issued before tokens carried a jti, only a user cutoff can revoke it
+        await revoke_user_sessions(db, principal.id)
+        return
+    expires_at = principal.expires_at or utils.token_expiry(
+        utils.token_timestamp(), _token_lifetime()
+    )
+    revoked = database.RevokedToken(
+        jti=principal.jti,
+        user_id=principal.id,
+        expires_at=database.timestamp_at(expires_at),
+    )
+    db.add(revoked)
+    await db.commit()
+    revocations.apply([revoked])
+
+
+async def revoke_user_sessions(db: database.DBSession, user_id: int) -> None:
+    """
+    Revoke every token issued to a user so far. Commits, and applies the revocation
+    to this process at once.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): Unique identifier of the user.
+    """
+    cutoff = _user_cutoff(user_id)
+    db.add(cutoff)
+    await db.commit()
+    revocations.apply([cutoff])
+
+
+async def load_revocations(db: database.DBSession) -> int:
+    """
+    Apply to the in-memory deny-list the unexpired revocations added since the
+    last load, then forget the expired ones.
+
+    Rows are read past the highest id already applied, and again for a few reload
+    intervals after they were written: an id allocated by a transaction that
+    committed after a higher one would otherwise be skipped.
+
+    Args:
+        db (DBSession): SQLAlchemy database session, on the primary database.
+
+    Returns:
+        int: Rows read.
+    """
+    now = database.timestamp_now()
+    since = now - timedelta(seconds=2 * settings.REVOCATION_RELOAD_SECONDS + 1)
+    rows = (
+        await db.scalars(
+            select(database.RevokedToken).where(
+                or_(
+                    database.RevokedToken.id > revocations.last_id,
+                    database.RevokedToken.revoked_at >= since,
+                ),
+                database.RevokedToken.expires_at > now,
+            )
+        )
+    ).all()
+    revocations.apply(rows)
+    revocations.prune()
+    return len(rows)
+
+
+async def delete_expired_revocations(db: database.DBSession) -> int:
+    """
+    Delete the revocations whose tokens have all expired. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+
+    Returns:
+        int: Rows deleted.
+    """
+    result = await db.execute(
+        delete(database.RevokedToken)
+        .where(database.RevokedToken.expires_at <= database.timestamp_now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def password_hash_costs(db: database.DBSession) -> Dict[str, int]:
+    """
+    Count users per bcrypt cost, read from the `$2b$<cost>$` prefix of the hashes.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+
+    Returns:
+        Dict[str, int]: Number of users per cost.
+    """
+    cost = func.substr(database.User.password_hash, 5, 2)
+    rows = await db.execute(select(cost, func.count()).group_by(cost).order_by(cost))
+    return {row[0]: row[1] for row in rows}
+
+
+# Challenges
+
+
+async def owns_challenge(
+    db: database.DBSession, challenge_id: int, user_id: int
+) -> bool:
+    """
+    Check whether a challenge exists and belongs to the user.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge.
+        user_id (int): The user expected to own it.
+
+    Returns:
+        bool: True if the user owns the challenge.
+    """
+    return await db.scalar(
+        select(
+            exists().where(
+                database.Challenge.id == challenge_id,
+                database.Challenge.user_id == user_id,
+            )
+        )
+    )
+
+
+def _owned_challenge_ids(user_id: int):
+    return select(database.Challenge.id).where(database.Challenge.user_id == user_id)
+
+
+async def get_owned_challenge(
+    db: database.DBSession,
+    challenge_id: int,
+    user_id: int,
+    columns: Optional[Sequence[InstrumentedAttribute]] = None,
+) -> Optional[Any]:
+    """
+    Fetch a challenge by ID if it belongs to the user.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge.
+        user_id (int): The user expected to own it.
+        columns (Sequence[InstrumentedAttribute], optional): `Challenge` columns to
+            select, returning a row of them instead of a `Challenge` object.
+
+    Returns:
+        Optional[Any]: The challenge, or None if it does not exist or belongs to
+            another user.
+    """
+    result = await db.execute(
+        select(*columns if columns else (database.Challenge,)).where(
+            database.Challenge.id == challenge_id,
+            database.Challenge.user_id == user_id,
+        )
+    )
+    return result.first() if columns else result.scalars().first()
+
+
+async def challenge_exists(db: database.DBSession, challenge_id: int) -> bool:
+    """
+    Check whether a challenge exists, regardless of its owner.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge.
+
+    Returns:
+        bool: True if the challenge exists.
+    """
+    return await db.scalar(
+        select(exists().where(database.Challenge.id == challenge_id))
+    )
+
+
+async def list_challenges(
+    db: database.DBSession,
+    user_id: int,
+    page: pagination.PageRequest,
+    columns: Optional[Sequence[InstrumentedAttribute]] = None,
+) -> List[Any]:
+    """
+    Fetch one page of the challenges owned by a user, ordered by
+    `(started_at, id)` along the `(user_id, started_at)` index.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): The owner.
+        page (pagination.PageRequest): Page to fetch, `from`/`to` bounding
+            `started_at`.
+        columns (Sequence[InstrumentedAttribute], optional): `Challenge` columns to
+            select, returning rows of them instead of `Challenge` objects. Must
+            include `id` and `started_at`, which paging relies on.
+
+    Returns:
+        List[Any]: Up to `page.limit + 1` challenges, the extra one signalling a
+            next page.
+    """
+    query = pagination.paginate(
+        (select(*columns) if columns else select(database.Challenge)).where(
+            database.Challenge.user_id == user_id
+        ),
+        page,
+        database.Challenge.started_at,
+        database.Challenge.id,
+    )
+    result = await db.execute(query)
+    return result.all() if columns else result.scalars().all()
+
+
+async def challenge_list_version(
+    db: database.DBSession, user_id: int
+) -> Tuple[Tuple, Optional[datetime]]:
+    """
+    Aggregate a user's challenges into values that change whenever the list does,
+    with one index-only query instead of loading the rows.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): The owner.
+
+    Returns:
+        Tuple[Tuple, Optional[datetime]]: Count, highest id and latest start date
+            of the challenges, and that latest start date.
+    """
+    count, last_id, last_started = (
+        await db.execute(
+            select(
+                func.count(),
+                func.max(database.Challenge.id),
+                func.max(database.Challenge.started_at),
+            ).where(database.Challenge.user_id == user_id)
+        )
+    ).one()
+    return (count, last_id, last_started), last_started
+
+
+async def create_challenge(
+    db: database.DBSession, challenge: database.Challenge
+) -> bool:
+    """
+    Insert a challenge, relying on the unique `(user_id, name)` index instead of a
+    prior lookup to detect a duplicate name. Commits on success, and drops the
+    owner's cached challenge list.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge (database.Challenge): The new challenge.
+
+    Returns:
+        bool: False if the user already has a challenge with this name.
+    """
+    if not await _add_unique(db, challenge):
+        return False
+    await cache.invalidate(cache.user_tag(challenge.user_id, "challenges"))
+    return True
+
+
+# Daily logs
+
+
+async def upsert_daily_log(
+    db: database.DBSession,
+    challenge_id: int,
+    log_date: date,
+    completed: bool,
+    on_conflict: schemas.OnConflict = schemas.OnConflict.reject,
+) -> Optional[dict]:
+    """
+    Insert a daily log with a single statement, resolving a clash on
+    `(challenge_id, log_date)` according to `on_conflict`.
+
+    MySQL uses `INSERT ... ON DUPLICATE KEY UPDATE` (or a plain `INSERT` whose
+    duplicate-key error is caught when rejecting), SQLite and PostgreSQL use
+    `INSERT ... ON CONFLICT ... RETURNING`. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Challenge the log belongs to.
+        log_date (date): Day being logged.
+        completed (bool): Whether the challenge was completed that day.
+        on_conflict (schemas.OnConflict, optional): `reject` keeps the existing log,
+            `overwrite` replaces its `completed` flag.
+
+    Returns:
+        Optional[dict]: The stored log (`id`, `challenge_id`, `log_date`, `completed`),
+            or None if a log already existed and `on_conflict` is `reject`.
+    """
+    values = {
+        "challenge_id": challenge_id,
+        "log_date": log_datetime(log_date),
+        "completed": completed,
+    }
+    dialect = dialect_name(db)
+    table = database.DailyLog.__table__
+    overwrite = on_conflict == schemas.OnConflict.overwrite
+
+    if dialect == "mysql":
+        statement = mysql.insert(table).values(**values)
+        if overwrite:
+            # LAST_INSERT_ID(id) makes lastrowid report the id of the updated row
+            statement = statement.on_duplicate_key_update(
+                completed=statement.inserted.completed,
+                updated_at=database.timestamp_now(),
+                id=func.last_insert_id(table.c.id),
+            )
+        try:
+            result = await db.execute(statement)
+        except IntegrityError as error:
+            if not is_duplicate_key(error):
+                raise
+            await db.rollback()
+            return None
+        await db.commit()
+        return {"id": result.lastrowid, **values}
+
+    # SQLite or PostgreSQL, the only other `database.SUPPORTED_DIALECTS`
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    statement = dialect_insert(table).values(**values)
+    conflict_target = [table.c.challenge_id, table.c.log_date]
+    if overwrite:
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_target,
+            set_={
+                "completed": statement.excluded.completed,
+                "updated_at": database.timestamp_now(),
+            },
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_target)
+    statement = statement.returning(
+        table.c.id, table.c.challenge_id, table.c.log_date, table.c.completed
+    )
+    row = (await db.execute(statement)).mappings().first()
+    await db.commit()
+    return dict(row) if row is not None else None
+
+
+def _chunks(items: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _multi_row_upsert(dialect: str, rows: List[dict], overwrite: bool):
+    """
+    Build one multi-row INSERT for `rows` that never fails on an existing
+    `(challenge_id, log_date)`: it either leaves the row alone or overwrites it.
+
+    On SQLite and PostgreSQL the statement returns each row it inserted or
+    overwrote, with its `updated_at` telling the two apart: only an update sets
+    it, and the overwrite always does. (`updated_at IS NULL` is not returned
+    instead, SQLite 3.40 evaluates it wrongly in a RETURNING clause.)
+    """
+    table = database.DailyLog.__table__
+    if dialect == "mysql":
+        statement = mysql.insert(table).values(rows)
+        if overwrite:
+            return statement.on_duplicate_key_update(
+                completed=statement.inserted.completed,
+                updated_at=database.timestamp_now(),
+            )
+        return statement.on_duplicate_key_update(id=table.c.id)
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    statement = dialect_insert(table).values(rows)
+    conflict_target = [table.c.challenge_id, table.c.log_date]
+    if overwrite:
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_target,
+            set_={
+                "completed": statement.excluded.completed,
+                "updated_at": database.timestamp_now(),
+            },
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_target)
+    return statement.returning(
+        table.c.id,
+        table.c.challenge_id,
+        table.c.log_date,
+        table.c.updated_at,
+    )
+
+
+async def _log_ids(
+    db: database.DBSession, keys: Set[Tuple[int, datetime]], lock: bool = False
+) -> Dict[Tuple[int, datetime], int]:
+    """
+    Look up the ids of the logs stored under exactly `keys`. With `lock`, the
+    rows found stay locked until the transaction ends, and on MySQL so do the
+    gaps of the unique index where the missing keys would go.
+    """
+    table = database.DailyLog.__table__
+    statement = select(table.c.challenge_id, table.c.log_date, table.c.id).where(
+        tuple_(table.c.challenge_id, table.c.log_date).in_(list(keys))
+    )
+    if lock:
+        statement = statement.with_for_update()
+    rows = await db.execute(statement)
+    return {(row.challenge_id, log_datetime(row.log_date)): row.id for row in rows}
+
+
+async def bulk_upsert_daily_logs(
+    db: database.DBSession,
+    user_id: int,
+    logs: Sequence[schemas.DailyLogCreate],
+    on_conflict: schemas.OnConflict = schemas.OnConflict.reject,
+    chunk_size: int = 500,
+) -> List[dict]:
+    """
+    Store many daily logs for one user with multi-row statements.
+
+    Ownership of every referenced challenge is checked with a single query.
+    The remaining logs are written in chunks of `chunk_size` rows, each with one
+    multi-row upsert. Whether a log was created or already existed is taken from
+    the upsert itself on SQLite and PostgreSQL, which return the rows they wrote;
+    the ids of logs left alone cost one more lookup. MySQL returns no rows, so
+    there the chunk's keys are first read with `FOR UPDATE`, which under InnoDB's
+    default REPEATABLE READ also locks the gaps where missing keys would go: no
+    concurrent insert can land between that read and the upsert. The ids are
+    then read back. When the same day appears twice in `logs`, the first one
+    wins under `reject` and the last one under `overwrite`. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): The user the challenges must belong to.
+        logs (Sequence[schemas.DailyLogCreate]): Logs to store.
+        on_conflict (schemas.OnConflict, optional): `reject` keeps existing logs,
+            `overwrite` replaces their `completed` flag.
+        chunk_size (int, optional): Rows per multi-row statement.
+
+    Returns:
+        List[dict]: One result per item of `logs`, in order, with its `index`,
+            `status` (a `schemas.BulkLogStatus`) and the stored log `id`, if any.
+    """
+    overwrite = on_conflict == schemas.OnConflict.overwrite
+    challenge_ids = {log.challenge_id for log in logs}
+    owned = set(
+        await db.scalars(
+            select(database.Challenge.id).where(
+                database.Challenge.id.in_(challenge_ids),
+                database.Challenge.user_id == user_id,
+            )
+        )
+    )
+
+    results: List[dict] = [
+        {"index": index, "status": schemas.BulkLogStatus.forbidden, "id": None}
+        for index in range(len(logs))
+    ]
+    # Indexes of the items sharing each (challenge_id, log_date) key
+    indexes_by_key: Dict[Tuple[int, datetime], List[int]] = {}
+    for index, log in enumerate(logs):
+        if log.challenge_id in owned:
+            key = (log.challenge_id, log_datetime(log.log_date))
+            indexes_by_key.setdefault(key, []).append(index)
+
+    dialect = dialect_name(db)
+    for chunk in _chunks(list(indexes_by_key), chunk_size):
+        keys = set(chunk)
+        rows = []
+        for key in chunk:
+            winner = logs[indexes_by_key[key][-1 if overwrite else 0]]
+            rows.append(
+                {
+                    "challenge_id": key[0],
+                    "log_date": key[1],
+                    "completed": winner.completed,
+                }
+            )
+        statement = _multi_row_upsert(dialect, rows, overwrite)
+        if dialect == "mysql":
+            created = keys.difference(await _log_ids(db, keys, lock=True))
+            await db.execute(statement)
+            stored = await _log_ids(db, keys)
+        else:
+            written = (await db.execute(statement)).all()
+            stored = {
+                (row.challenge_id, log_datetime(row.log_date)): row.id
+                for row in written
+            }
+            created = {
+                (row.challenge_id, log_datetime(row.log_date))
+                for row in written
+                if row.updated_at is None
+            }
+            left_alone = keys.difference(stored)
+            if left_alone:
+                stored.update(await _log_ids(db, left_alone))
+
+        for key in chunk:
+            indexes = indexes_by_key[key]
+            winner = indexes[-1 if overwrite else 0]
+            for index in indexes:
+                if index != winner:
+                    item_status = schemas.BulkLogStatus.duplicate
+                elif key in created:
+                    item_status = schemas.BulkLogStatus.created
+                elif overwrite:
+                    item_status = schemas.BulkLogStatus.overwritten
+                else:
+                    item_status = schemas.BulkLogStatus.duplicate
+                results[index].update(status=item_status, id=stored.get(key))
+    await db.commit()
+    return results
+
+
+def _log_columns():
+    table = database.DailyLog.__table__
+    return table.c.id, table.c.challenge_id, table.c.log_date, table.c.completed
+
+
+async def list_owned_logs(
+    db: database.DBSession,
+    challenge_id: int,
+    user_id: int,
+    page: pagination.PageRequest,
+    columns: Optional[Sequence[InstrumentedAttribute]] = None,
+) -> Optional[List[Any]]:
+    """
+    Fetch one page of the logs of a challenge, ordered by `(log_date, id)` along
+    the `(challenge_id, log_date)` index. The query joins the challenge so that the
+    ownership check is part of it.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge.
+        user_id (int): The user expected to own the challenge.
+        page (pagination.PageRequest): Page to fetch, `from`/`to` bounding
+            `log_date`.
+        columns (Sequence[InstrumentedAttribute], optional): `DailyLog` columns to
+            select, returning rows of them instead of `DailyLog` objects. Must
+            include `id` and `log_date`, which paging relies on.
+
+    Returns:
+        Optional[List[Any]]: Up to `page.limit + 1` logs, the extra one signalling
+            a next page, or None if the challenge does not exist or belongs to
+            another user.
+    """
+    query = pagination.paginate(
+        (select(*columns) if columns else select(database.DailyLog))
+        .select_from(database.DailyLog)
+        .join(database.Challenge)
+        .where(
+            database.DailyLog.challenge_id == challenge_id,
+            database.Challenge.user_id == user_id,
+        ),
+        page,
+        database.DailyLog.log_date,
+        database.DailyLog.id,
+    )
+    result = await db.execute(query)
+    logs = result.all() if columns else result.scalars().all()
+    # An empty result is ambiguous, only then is ownership checked separately
+    if not logs and not await owns_challenge(db, challenge_id, user_id):
+        return None
+    return logs
+
+
+async def owned_log_list_version(
+    db: database.DBSession, challenge_id: int, user_id: int
+) -> Tuple[Tuple, Optional[datetime]]:
+    """
+    Aggregate the logs of a challenge owned by a user into values that change
+    whenever the list does, without loading the rows.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge.
+        user_id (int): The user expected to own the challenge.
+
+    Returns:
+        Tuple[Tuple, Optional[datetime]]: Count, highest id, latest change and
+            number of completed logs, and that latest change. The count is 0 if the
+            challenge has no logs, does not exist or belongs to another user.
+    """
+    changed = func.coalesce(database.DailyLog.updated_at, database.DailyLog.created_at)
+    count, last_id, last_changed, completed = (
+        await db.execute(
+            select(
+                func.count(),
+                func.max(database.DailyLog.id),
+                func.max(changed),
+                func.sum(case((database.DailyLog.completed, 1), else_=0)),
+            )
+            .join(database.Challenge)
+            .where(
+                database.DailyLog.challenge_id == challenge_id,
+                database.Challenge.user_id == user_id,
+            )
+        )
+    ).one()
+    return (count, last_id, last_changed, completed), last_changed
+
+
+async def log_exists(db: database.DBSession, log_id: int) -> bool:
+    """
+    Check whether a daily log exists, regardless of its owner.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        log_id (int): Unique identifier of the log.
+
+    Returns:
+        bool: True if the log exists.
+    """
+    return await db.scalar(select(exists().where(database.DailyLog.id == log_id)))
+
+
+async def update_owned_log(
+    db: database.DBSession, log_id: int, user_id: int, completed: bool
+) -> Optional[dict]:
+    """
+    Update a daily log if its challenge belongs to the user, in a single
+    `UPDATE ... WHERE challenge_id IN (<user's challenges>)` statement that
+    returns the row where the dialect supports `RETURNING`. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        log_id (int): Unique identifier of the log.
+        user_id (int): The user expected to own the log's challenge.
+        completed (bool): New completion flag.
+
+    Returns:
+        Optional[dict]: The updated log, or None if it does not exist or belongs
+            to another user.
+    """
+    statement = (
+        update(database.DailyLog)
+        .where(
+            database.DailyLog.id == log_id,
+            database.DailyLog.challenge_id.in_(_owned_challenge_ids(user_id)),
+        )
+        .values(completed=completed, updated_at=database.timestamp_now())
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        row = (await db.execute(statement.returning(*_log_columns()))).mappings()
+        row = row.first()
+        await db.commit()
+        return dict(row) if row is not None else None
+
+    result = await db.execute(statement)
+    if result.rowcount == 0:
+        await db.rollback()
+        return None
+    row = (
+        (
+            await db.execute(
+                select(*_log_columns()).where(database.DailyLog.id == log_id)
+            )
+        )
+        .mappings()
+        .first()
+    )
+    await db.commit()
+    return dict(row)
+
+
+async def delete_owned_log(db: database.DBSession, log_id: int, user_id: int) -> bool:
+    """
+    Delete a daily log if its challenge belongs to the user, in a single
+    `DELETE` statement. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        log_id (int): Unique identifier of the log.
+        user_id (int): The user expected to own the log's challenge.
+
+    Returns:
+        bool: False if the log does not exist or belongs to another user.
+    """
+    result = await db.execute(
+        delete(database.DailyLog)
+        .where(
+            database.DailyLog.id == log_id,
+            database.DailyLog.challenge_id.in_(_owned_challenge_ids(user_id)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+# Shared challenges
+
+
+async def share_owned_challenge(
+    db: database.DBSession, challenge_id: int, owner_id: int, shared_user_id: int
+) -> Optional[dict]:
+    """
+    Share a challenge owned by `owner_id` with another user. One query loads the
+    owned challenge and checks that the recipient exists, one inserts the share.
+    Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        challenge_id (int): Unique identifier of the challenge to share.
+        owner_id (int): The user expected to own the challenge.
+        shared_user_id (int): The user to share the challenge with.
+
+    Returns:
+        Optional[dict]: The share with the challenge's fields, shaped like
+            `schemas.SharedChallengeResponse` minus `shared_by`, or None if the
+            challenge is not owned by `owner_id` or the recipient does not exist.
+    """
+    challenge = (
+        await db.execute(
+            select(
+                database.Challenge.name,
+                database.Challenge.description,
+                database.Challenge.started_at,
+                database.Challenge.completed_at,
+            ).where(
+                database.Challenge.id == challenge_id,
+                database.Challenge.user_id == owner_id,
+                exists().where(database.User.id == shared_user_id),
+            )
+        )
+    ).first()
+    if challenge is None:
+        return None
+
+    shared_at = database.timestamp_now()
+    result = await db.execute(
+        insert(database.SharedChallenge).values(
+            challenge_id=challenge_id,
+            shared_user_id=shared_user_id,
+            shared_at=shared_at,
+        )
+    )
+    await db.commit()
+    return {
+        "id": result.inserted_primary_key[0],
+        "challenge_id": challenge_id,
+        "shared_at": shared_at,
+        **challenge._asdict(),
+    }
+
+
+def _shared_with_columns() -> Dict[str, ColumnElement]:
+    return {
+        "id": database.SharedChallenge.id,
+        "challenge_id": database.Challenge.id.label("challenge_id"),
+        "name": database.Challenge.name,
+        "description": database.Challenge.description,
+        "started_at": database.Challenge.started_at,
+        "completed_at": database.Challenge.completed_at,
+        "shared_at": database.SharedChallenge.shared_at,
+        "shared_by": database.User.username.label("shared_by"),
+    }
+
+
+async def list_shared_with(
+    db: database.DBSession, user_id: int, fields: Optional[Sequence[str]] = None
+) -> List[dict]:
+    """
+    Fetch the challenges shared with a user as response rows, projecting the
+    share, challenge and owner columns in one joined query instead of loading
+    ORM objects.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): The recipient.
+        fields (Sequence[str], optional): Fields of `SharedChallengeResponse` to
+            select, all of them by default.
+
+    Returns:
+        List[dict]: One row per share, with the requested fields of
+            `SharedChallengeResponse`.
+    """
+    columns = _shared_with_columns()
+    shares = await db.execute(
+        select(
+            *(
+                column
+                for name, column in columns.items()
+                if fields is None or name in fields
+            )
+        )
+        .select_from(database.SharedChallenge)
+        .join(
+            database.Challenge,
+            database.Challenge.id == database.SharedChallenge.challenge_id,
+        )
+        .join(database.User, database.User.id == database.Challenge.user_id)
+        .where(database.SharedChallenge.shared_user_id == user_id)
+        .order_by(database.SharedChallenge.id)
+    )
+    return [dict(row) for row in shares.mappings()]
+
+
+async def shared_with_version(
+    db: database.DBSession, user_id: int
+) -> Tuple[Tuple, Optional[datetime]]:
+    """
+    Aggregate the shares with a user into values that change whenever the inbox
+    does, without the joins of `list_shared_with`.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        user_id (int): The recipient.
+
+    Returns:
+        Tuple[Tuple, Optional[datetime]]: Count, highest id and latest date of the
+            shares, and that latest date.
+    """
+    count, last_id, last_shared = (
+        await db.execute(
+            select(
+                func.count(),
+                func.max(database.SharedChallenge.id),
+                func.max(database.SharedChallenge.shared_at),
+            ).where(database.SharedChallenge.shared_user_id == user_id)
+        )
+    ).one()
+    return (count, last_id, last_shared), last_shared
+
+
+async def share_exists(db: database.DBSession, shared_challenge_id: int) -> bool:
+    """
+    Check whether a share exists, regardless of the challenge owner.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        shared_challenge_id (int): Unique identifier of the share.
+
+    Returns:
+        bool: True if the share exists.
+    """
+    return await db.scalar(
+        select(exists().where(database.SharedChallenge.id == shared_challenge_id))
+    )
+
+
+async def delete_owned_share(
+    db: database.DBSession, shared_challenge_id: int, owner_id: int
+) -> bool:
+    """
+    Delete a share if the shared challenge belongs to `owner_id`, in a single
+    `DELETE` statement. Commits.
+
+    Args:
+        db (DBSession): SQLAlchemy database session.
+        shared_challenge_id (int): Unique identifier of the share.
+        owner_id (int): The user expected to own the shared challenge.
+
+    Returns:
+        bool: False if the share does not exist or the challenge is not owned by
+            `owner_id`.
+    """
+    result = await db.execute(
+        delete(database.SharedChallenge)
+        .where(
+            database.SharedChallenge.id == shared_challenge_id,
+            database.SharedChallenge.challenge_id.in_(_owned_challenge_ids(owner_id)),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+def export_queries(user_id: int) -> Dict[str, Select]:
+    """
+    Build the queries reading everything a user's data export holds: their
+    challenges, the logs of those challenges, and the shares they made or
+    received.
+
+    Args:
+        user_id (int): The exported user.
+
+    Returns:
+        Dict[str, Select]: One query per kind of record, in export order.
+    """
+    challenges = database.Challenge.__table__.c
+    shares = database.SharedChallenge.__table__.c
+    return {
+        "challenge": select(
+            challenges.id,
+            challenges.name,
+            challenges.description,
+            challenges.started_at,
+            challenges.completed_at,
+        )
+        .where(challenges.user_id == user_id)
+        .order_by(challenges.id),
+        "daily_log": select(*_log_columns())
+        .where(database.DailyLog.challenge_id.in_(_owned_challenge_ids(user_id)))
+        .order_by(database.DailyLog.challenge_id, database.DailyLog.log_date),
+        "shared_challenge": select(
+            shares.id, shares.challenge_id, shares.shared_user_id, shares.shared_at
+        )
+        .where(
+            or_(
+                shares.challenge_id.in_(_owned_challenge_ids(user_id)),
+                shares.shared_user_id == user_id,
+            )
+        )
+        .order_by(shares.id),
+    }
+
+
+async def stream_rows(
+    db: database.DBSession, query: Select, chunk_size: int
+) -> AsyncIterator[Sequence]:
+    """
+    Read a query's rows through a server-side cursor, `chunk_size` at a time, so
+    that no more than one chunk is held in memory whatever the result size.
+
+    Args:
+        db (DBSession): SQLAlchemy database session, busy until the rows are read.
+        query (Select): A Core query, so rows are not tracked by the session.
+        chunk_size (int): Rows fetched per round trip.
+
+    Yields:
+        Sequence: The next rows.
+    """
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    try:
+        async for rows in result.partitions(chunk_size):
+            yield rows
+    finally:
+        await result.close()
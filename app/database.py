@@ -1,22 +1,83 @@
-from typing import Generator, List
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
 
+import anyio
+from fastapi import Depends
 from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
+    Integer,
     String,
+    UniqueConstraint,
     create_engine,
-    func,
 )
+from sqlalchemy.engine import Result, Row, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, Session, relationship, sessionmaker
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
 
+from app import cache
 from app.config import settings
+from app.pool import PoolStats, describe_pool, instrumented_pool_class
+from app.schemas import TokenData
+from app.utils import verify_token
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# SQLite only auto-increments INTEGER primary keys, so map BIGINT ids to INTEGER there
+BigIntegerPK = BigInteger().with_variant(Integer, "sqlite")
+
+
+def timestamp_now() -> datetime:
+    """
+    Current time as stored in the timestamp columns.
+
+    Timestamps are set by the application rather than the database, so a freshly
+    written row already holds them and does not need reloading after the commit.
+    Microseconds are dropped since MySQL `TIMESTAMP` columns keep whole seconds.
+
+    Returns:
+        datetime: The current local time, truncated to the second.
+    """
+    return datetime.now().replace(microsecond=0)
+
+
+def timestamp_at(seconds: float) -> datetime:
+    """
+    A UNIX timestamp as stored in the timestamp columns, rounded up to the second.
+
+    Args:
+        seconds (float): The UNIX timestamp, e.g. a token's `exp`.
+
+    Returns:
+        datetime: The same instant in local time, comparable with `timestamp_now`.
+    """
+    return datetime.fromtimestamp(math.ceil(seconds))
+
 
 class User(Base):
     """
@@ -33,11 +94,11 @@ class User(Base):
 
     __tablename__ = "users"
 
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     email = Column(String(100), unique=True, nullable=False)
-    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
     is_active = Column(Boolean, default=True)
 
     challenges: Mapped[List["Challenge"]] = relationship(
@@ -59,12 +120,18 @@ class Challenge(Base):
     """
 
     __tablename__ = "challenges"
+    __table_args__ = (
+        # Also serves the `user_id` filter as its leftmost prefix
+        UniqueConstraint("user_id", "name", name="uq_challenges_user_id_name"),
+        # Keyset pagination of a user's challenges by `(started_at, id)`
+        Index("ix_challenges_user_id_started_at", "user_id", "started_at"),
+    )
 
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     name = Column(String(100), nullable=False)
     description = Column(String)
-    started_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
     completed_at = Column(DateTime(timezone=True), nullable=True)
 
     user: Mapped["User"] = relationship("User", back_populates="challenges")
@@ -87,13 +154,18 @@ class DailyLog(Base):
     """
 
     __tablename__ = "daily_logs"
+    __table_args__ = (
+        UniqueConstraint(
+            "challenge_id", "log_date", name="uq_daily_logs_challenge_id_log_date"
+        ),
+    )
 
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     challenge_id = Column(BigInteger, ForeignKey("challenges.id"), nullable=False)
-    log_date = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    log_date = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
     completed = Column(Boolean, nullable=False, default=False)  # Default to False
-    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=timestamp_now)
 
     challenge: Mapped["Challenge"] = relationship(
         "Challenge", back_populates="daily_logs"
@@ -112,33 +184,506 @@ class SharedChallenge(Base):
     """
 
     __tablename__ = "shared_challenges"
+    __table_args__ = (
+        Index("ix_shared_challenges_shared_user_id", "shared_user_id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     challenge_id = Column(BigInteger, ForeignKey("challenges.id"), nullable=False)
     shared_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
-    shared_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    shared_at = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
 
     challenge: Mapped["Challenge"] = relationship("Challenge", backref="shared_with")
     shared_user: Mapped["User"] = relationship("User", backref="shared_challenges")
 
 
-# Create the SQLAlchemy engine to connect to the database
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+class RevokedToken(Base):
+    """
+    Represents a token revocation, loaded into the in-memory deny-list.
+
+    A row revokes either one token, by its `jti`, or every token of the user issued
+    before `issued_before_ms`. Rows can be deleted once `expires_at` has passed.
+
+    Attributes:
+        id (int): Unique identifier, also the watermark of incremental reloads.
+        jti (str, optional): Unique identifier of the revoked token.
+        user_id (int): Foreign key linking to the user owning the token(s).
+        issued_before_ms (int, optional): Tokens of the user issued before this
+            time, in milliseconds since the epoch, are revoked.
+        revoked_at (datetime): Date and time of the revocation.
+        expires_at (datetime): Date and time after which every revoked token has
+            expired.
+    """
+
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+        Index("ix_revoked_tokens_expires_at", "expires_at"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, index=True)
+    jti = Column(String(32), nullable=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    issued_before_ms = Column(BigInteger, nullable=True)
+    revoked_at = Column(DateTime(timezone=True), default=timestamp_now, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# Async drivers used in place of the sync DBAPI when DATABASE_ASYNC is enabled
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+# Dialects the app's statements are written for, see the upserts of `app.crud`
+SUPPORTED_DIALECTS = ("mysql", "postgresql", "sqlite")
+
+
+def async_database_url(url: str) -> str:
+    """
+    Translate a sync database URL into the equivalent URL for its async driver.
+
+    Args:
+        url (str): Database URL using a sync DBAPI (e.g. `mysql+pymysql://...`).
+
+    Returns:
+        str: The same URL using the async driver (e.g. `mysql+aiomysql://...`).
+    """
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def engine_options(url: str, stats: PoolStats) -> dict:
+    """
+    Build the keyword arguments used to create an engine for the given URL.
+
+    The pool settings from `Settings` apply to queue-based pools; SQLite in-memory
+    and aiosqlite databases keep the single-connection pools of their dialect.
+
+    Args:
+        url (str): Database URL the engine will connect to.
+        stats (PoolStats): Collector for the pool's checkout waits.
+
+    Returns:
+        dict: Keyword arguments for `create_engine` / `create_async_engine`.
+    """
+    parsed = make_url(url)
+    pool_class = parsed.get_dialect().get_pool_class(parsed)
+    options: dict = {
+        "poolclass": instrumented_pool_class(pool_class, stats),
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if issubclass(pool_class, QueuePool):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    if parsed.get_backend_name() == "sqlite":
+        # Sync sessions hop between threadpool workers, see ThreadedSession
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+class ThreadedStreamResult:
+    """
+    Awaitable facade over a sync `Result` reading from a server-side cursor,
+    mirroring the part of `AsyncResult` used to stream rows.
+
+    Attributes:
+        result (Result): The wrapped sync result.
+    """
+
+    def __init__(self, result: Result) -> None:
+        self.result = result
+
+    async def partitions(self, size: int) -> AsyncIterator[Sequence[Row]]:
+        """
+        Fetch the rows in lists of at most `size`, each fetched on the threadpool.
+
+        Args:
+            size (int): Rows per list.
+
+        Yields:
+            Sequence[Row]: The next rows.
+        """
+        while True:
+            rows = await run_in_threadpool(self.result.fetchmany, size)
+            if not rows:
+                return
+            yield rows
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.result.close)
+
+
+class ThreadedSession:
+    """
+    Awaitable facade over a sync `Session`, used when DATABASE_ASYNC is disabled.
+
+    It exposes the subset of the `AsyncSession` API used by the routers and runs
+    every blocking call on the threadpool, so handlers are written once as
+    `async def` and work unchanged in both modes.
+
+    Attributes:
+        sync_session (Session): The wrapped sync SQLAlchemy session.
+    """
+
+    def __init__(self, sync_session: Session) -> None:
+        self.sync_session = sync_session
+
+    @property
+    def bind(self) -> Any:
+        return self.sync_session.bind
+
+    def get_bind(self, *args: Any, **kwargs: Any) -> Any:
+        return self.sync_session.get_bind(*args, **kwargs)
+
+    def add(self, instance: object) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances: Iterable[object]) -> None:
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        # Buffer ORM rows like AsyncSession does, so no cursor outlives the call
+        kwargs.setdefault("execution_options", {"prebuffer_rows": True})
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, *args, **kwargs
+        )
+
+    async def stream(
+        self, statement: Any, *args: Any, **kwargs: Any
+    ) -> ThreadedStreamResult:
+        # Like AsyncSession.stream: rows come from a server-side cursor, unbuffered
+        options = {**kwargs.pop("execution_options", {}), "stream_results": True}
+        result = await run_in_threadpool(
+            self.sync_session.execute,
+            statement,
+            *args,
+            execution_options=options,
+            **kwargs,
+        )
+        return ThreadedStreamResult(result)
+
+    async def scalar(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(
+            self.sync_session.scalar, statement, *args, **kwargs
+        )
+
+    async def scalars(self, statement: Any, *args: Any, **kwargs: Any) -> Any:
+        result = await self.execute(statement, *args, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity: Any, ident: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance: object) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance: object) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
 
-# Create a session factory bound to the engine
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
 
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
 
-def get_db() -> Generator[Session, None, None]:
+
+# Session type handed to the routers in either mode
+DBSession = Union[AsyncSession, ThreadedSession]
+
+
+class SessionSource:
+    """
+    Engines and session factories for one database server, the primary or a
+    replica. Servers outside SUPPORTED_DIALECTS are refused with a `ValueError`.
+
+    Attributes:
+        engine (Engine): Sync engine, also used by migrations and scripts.
+        session_factory (sessionmaker): Factory of sync sessions on `engine`.
+        slots (anyio.Semaphore): Caps concurrent sync sessions at the pool capacity.
+        slot_stats (PoolStats): Waits for a slot, where sync sessions queue in
+            place of the pool's checkout.
+        async_engine (Optional[AsyncEngine]): Async engine, only in async mode.
+        async_session_factory (Optional[async_sessionmaker]): Factory of async
+            sessions on `async_engine`, only in async mode.
     """
-    Provides a database session for each request and ensures it is closed afterward.
+
+    def __init__(self, url: str, use_async: bool) -> None:
+        dialect = make_url(url).get_backend_name()
+        if dialect not in SUPPORTED_DIALECTS:
+            raise ValueError(
+                f"Unsupported database dialect: {dialect}, expected one of "
+                f"{', '.join(SUPPORTED_DIALECTS)}"
+            )
+        self.engine = create_engine(url, **engine_options(url, PoolStats()))
+        # Objects are not expired on commit: the rows a request just wrote stay
+        # readable without another SELECT
+        self.session_factory = sessionmaker(
+            autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine
+        )
+        # A sync session only gets threadpool slots once a pooled connection is
+        # guaranteed, otherwise requests holding connections can starve waiting for
+        # threads that are all blocked on the exhausted pool
+        self.slots = anyio.Semaphore(
+            self.engine.pool.size()
+            + max(getattr(self.engine.pool, "_max_overflow", 0), 0)
+        )
+        self.slot_stats = PoolStats()
+
+        self.async_engine = None
+        self.async_session_factory: Optional[async_sessionmaker] = None
+        if use_async:
+            async_url = async_database_url(url)
+            self.async_engine = create_async_engine(
+                async_url, **engine_options(async_url, PoolStats())
+            )
+            self.async_session_factory = async_sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                expire_on_commit=False,
+                bind=self.async_engine,
+            )
+
+    def pool_status(self) -> dict:
+        """
+        Report the pool serving requests from this server.
+
+        Returns:
+            dict: Pool occupancy and checkout waits, plus in sync mode the waits
+                for a session slot under `slot_waits`.
+        """
+        if self.async_engine is not None:
+            return describe_pool(self.async_engine.sync_engine.pool)
+        status = describe_pool(self.engine.pool)
+        status["slot_waits"] = self.slot_stats.snapshot()
+        return status
+
+    async def _acquire_slot(self) -> None:
+        # Slots admit no more sessions than the pool holds connections, so the
+        # pool never blocks: the wait, and its DB_POOL_TIMEOUT, happen here
+        started = time.perf_counter()
+        try:
+            with anyio.fail_after(settings.DB_POOL_TIMEOUT):
+                await self.slots.acquire()
+        except TimeoutError:
+            self.slot_stats.record_timeout()
+            raise PoolTimeoutError(
+                f"No database session slot free after {settings.DB_POOL_TIMEOUT}s"
+            ) from None
+        self.slot_stats.record_wait(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[DBSession]:
+        """
+        Provide one session and close it afterwards, also when the request fails.
+
+        Yields:
+            DBSession: An `AsyncSession` in async mode, a `ThreadedSession`
+                otherwise.
+        """
+        if self.async_session_factory is not None:
+            db = self.async_session_factory()
+            try:
+                yield db
+            finally:
+                await db.close()
+            return
+
+        await self._acquire_slot()
+        try:
+            db = ThreadedSession(self.session_factory())
+            try:
+                yield db
+            finally:
+                await db.close()
+        finally:
+            self.slots.release()
+
+
+class RecentWriters:
+    """
+    Remembers which users wrote recently, so that their reads stay on the primary
+    until replicas have caught up with their writes.
+
+    Marks are kept in this process and in the cache `backend`, which every worker
+    process shares when CACHE_BACKEND is `redis`: a write handled by one worker
+    also routes the reads another worker serves. A mark that cannot be checked
+    counts as recent, sending the read to the primary. Only used from the event
+    loop, so no locking is needed.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._until: Dict[int, float] = {}
+
+    def _key(self, user_id: int) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}recent_writer:{user_id}"
+
+    async def mark(self, user_id: int) -> None:
+        """
+        Pin the user's reads to the primary for the next `window` seconds.
+
+        Args:
+            user_id (int): The user who is writing.
+        """
+        now = time.monotonic()
+        if len(self._until) >= 10000:
+            # Forget expired users, keeping the map bounded by the active writers
+            self._until = {
+                user: until for user, until in self._until.items() if until > now
+            }
+        self._until[user_id] = now + self.window
+        try:
+            await cache.backend.set(self._key(user_id), b"1", self.window, (), ())
+        except cache.CacheError:
+            logger.warning(
+                "Sharing the write of user %s failed", user_id, exc_info=True
+            )
+
+    async def is_recent(self, user_id: int) -> bool:
+        """
+        Check whether the user wrote within the last `window` seconds, through any
+        worker process.
+
+        Args:
+            user_id (int): The user about to read.
+
+        Returns:
+            bool: True if the user's reads must go to the primary.
+        """
+        if self._until.get(user_id, 0.0) > time.monotonic():
+            return True
+        try:
+            value, _ = await cache.backend.get(self._key(user_id), ())
+        except cache.CacheError:
+            return True
+        return value is not None
+
+
+# Primary database, every write goes here
+primary = SessionSource(settings.DATABASE_URL, settings.DATABASE_ASYNC)
+engine = primary.engine
+SessionLocal = primary.session_factory
+async_engine = primary.async_engine
+AsyncSessionLocal = primary.async_session_factory
+
+# Read replicas, serving the reads of users who have not written recently
+replicas = [
+    SessionSource(url, settings.DATABASE_ASYNC)
+    for url in settings.DATABASE_REPLICA_URLS
+]
+_next_replica = itertools.cycle(range(len(replicas)))
+recent_writers = RecentWriters(settings.READ_YOUR_WRITES_SECONDS)
+
+
+def pool_status() -> dict:
+    """
+    Report the connection pools serving requests.
+
+    Returns:
+        dict: Pool occupancy and checkout waits, keyed by engine role.
+    """
+    status = {"primary": primary.pool_status()}
+    for index, replica in enumerate(replicas):
+        status[f"replica_{index}"] = replica.pool_status()
+    return status
+
+
+async def read_source(user_id: int) -> SessionSource:
+    """
+    Pick the database serving a user's reads: a replica, unless none is configured
+    or the user wrote within the last READ_YOUR_WRITES_SECONDS.
+
+    Args:
+        user_id (int): The user about to read.
+
+    Returns:
+        SessionSource: The primary or the next replica.
+    """
+    if replicas and not await recent_writers.is_recent(user_id):
+        return replicas[next(_next_replica)]
+    return primary
+
+
+@asynccontextmanager
+async def read_session(user_id: int) -> AsyncIterator[DBSession]:
+    """
+    Provide a session on the database picked by `read_source`, closed afterwards.
+
+    Args:
+        user_id (int): The user about to read.
+
+    Yields:
+        DBSession: The SQLAlchemy database session.
+    """
+    source = await read_source(user_id)
+    async with source.session() as db:
+        yield db
+
+
+async def get_db() -> AsyncGenerator[DBSession, None]:
+    """
+    Provides a session on the primary database for each request and ensures it is
+    closed afterward.
+
+    With DATABASE_ASYNC enabled this is an `AsyncSession` on the async engine,
+    otherwise a `ThreadedSession` wrapping a sync session from `SessionLocal`.
 
     Yields:
-        Session: The SQLAlchemy database session.
+        DBSession: The SQLAlchemy database session.
     """
-    db = SessionLocal()  # Create a new session
+    async with primary.session() as db:
+        yield db
+
+
+async def get_write_db(
+    current_user: TokenData = Depends(verify_token),
+) -> AsyncGenerator[DBSession, None]:
+    """
+    Provides a primary session for a request writing on behalf of a user, whose
+    reads then stay on the primary for READ_YOUR_WRITES_SECONDS.
+
+    Args:
+        current_user (TokenData): The authenticated user.
+
+    Yields:
+        DBSession: The SQLAlchemy database session.
+    """
+    # Marked before the write as well, so reads racing with it skip the replicas
+    await recent_writers.mark(current_user.id)
     try:
-        yield db  # Provide the session to the request handler
+        async with primary.session() as db:
+            yield db
     finally:
-        db.close()  # Ensure the session is closed after the request
+        await recent_writers.mark(current_user.id)
+
+
+async def get_read_db(
+    current_user: TokenData = Depends(verify_token),
+) -> AsyncGenerator[DBSession, None]:
+    """
+    Provides a session for a read-only request, on a replica unless none is
+    configured or the user wrote within the last READ_YOUR_WRITES_SECONDS.
+
+    Args:
+        current_user (TokenData): The authenticated user.
+
+    Yields:
+        DBSession: The SQLAlchemy database session.
+    """
+    async with read_session(current_user.id) as db:
+        yield db
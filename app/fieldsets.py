@@ -0,0 +1,99 @@
+"""
+Sparse fieldsets: the `fields` query parameter of read endpoints.
+
+A client asking for `?fields=id,name` gets only those fields, and only the
+columns behind them are selected, so large unrequested columns such as a
+challenge's description are neither read from the database nor encoded.
+"""
+
+import functools
+from typing import Callable, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel
+
+from app.serialization import RowSerializer
+
+# Fields requested, in the response model's declaration order; None for all
+Fieldset = Optional[Tuple[str, ...]]
+
+
+def fields_query(model: Type[BaseModel]) -> Callable[..., Fieldset]:
+    """
+    Build the dependency parsing the `fields` query parameter of an endpoint
+    responding with `model`.
+
+    Args:
+        model (Type[BaseModel]): The endpoint's response model.
+
+    Returns:
+        Callable[..., Fieldset]: The dependency.
+    """
+    names = tuple(model.model_fields)
+
+    def fields_dependency(
+        fields: Optional[str] = Query(
+            None,
+            description=(
+                "Comma-separated fields to return, among "
+                f"{', '.join(names)}. All of them by default."
+            ),
+        ),
+    ) -> Fieldset:
+        """
+        Dependency parsing the `fields` query parameter.
+
+        Args:
+            fields (str, optional): Comma-separated names of the fields to return.
+
+        Returns:
+            Fieldset: The requested fields in declaration order, None for all.
+
+        Raises:
+            HTTPException: If no field or an unknown field is named.
+        """
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(names)
+        if not requested or unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid fields: {', '.join(sorted(unknown)) or fields!r}",
+            )
+        return tuple(name for name in names if name in requested)
+
+    return fields_dependency
+
+
+def columns(entity: type, fieldset: Fieldset, required: Sequence[str] = ()) -> Tuple:
+    """
+    Pick the columns of a mapped class needed to answer with a fieldset.
+
+    Args:
+        entity (type): The mapped class, e.g. `database.Challenge`.
+        fieldset (Fieldset): The requested fields, named as the class' columns.
+        required (Sequence[str], optional): Columns selected in any case, e.g. the
+            sort key paging relies on.
+
+    Returns:
+        Tuple: The columns to select.
+    """
+    names = dict.fromkeys([*required, *fieldset])
+    return tuple(getattr(entity, name) for name in names)
+
+
+@functools.lru_cache(maxsize=None)
+def serializer(model: Type[BaseModel], fieldset: Fieldset) -> RowSerializer:
+    """
+    Get the `RowSerializer` of a response model trimmed to a fieldset, compiled
+    once per distinct fieldset.
+
+    Args:
+        model (Type[BaseModel]): The response model.
+        fieldset (Fieldset): The requested fields, None for all.
+
+    Returns:
+        RowSerializer: The serializer.
+    """
+    return RowSerializer(model, fieldset)
@@ -0,0 +1,192 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import bcrypt
+
+from app.config import settings
+from app.pool import WAIT_BUCKETS_MS, histogram, wait_bucket
+
+
+class HasherBusy(Exception):
+    """
+    Raised when every password hashing worker is busy and the queue is full.
+
+    Attributes:
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def hash_cost(password_hash: str) -> Optional[int]:
+    """
+    Read the work factor of a bcrypt hash (`$2b$<cost>$...`).
+
+    Args:
+        password_hash (str): A stored bcrypt hash.
+
+    Returns:
+        Optional[int]: The cost, or None if the hash is not in bcrypt format.
+    """
+    parts = password_hash.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated process pool instead of the shared threadpool.
+
+    bcrypt is pure CPU work, so a burst of logins on the threadpool would take the
+    slots every database-bound handler needs. Here at most `workers` hashes run at
+    once and `queue_size` more wait; further calls fail fast with `HasherBusy`.
+    Only used from the event loop, so the counters need no locking.
+
+    Attributes:
+        rounds (int): bcrypt work factor of new hashes.
+        workers (int): Worker processes.
+        queue_size (int): Calls allowed to wait for a worker.
+        retry_after (int): Seconds suggested to rejected clients.
+    """
+
+    def __init__(
+        self, rounds: int, workers: int, queue_size: int, retry_after: int
+    ) -> None:
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.buckets: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # Started on first use, so importing the app does not spawn processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, function: Callable, *args: Any) -> Any:
+        if self._in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HasherBusy(self.retry_after)
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, function, *args
+            )
+        finally:
+            self._in_flight -= 1
+            self._record(time.perf_counter() - started)
+
+    def _record(self, seconds: float) -> None:
+        self.completed += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self.buckets[wait_bucket(seconds)] += 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password with a fresh salt at the configured cost.
+
+        Args:
+            password (str): The plain-text password.
+
+        Returns:
+            str: The bcrypt hash.
+
+        Raises:
+            HasherBusy: If the hashing queue is full.
+        """
+        hashed = await self._run(_hash, password.encode("utf-8"), self.rounds)
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """
+        Check a password against its stored bcrypt hash.
+
+        Args:
+            password (str): The plain-text password.
+            password_hash (str): The stored hash.
+
+        Returns:
+            bool: True if the password matches.
+
+        Raises:
+            HasherBusy: If the hashing queue is full.
+        """
+        return await self._run(
+            bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8")
+        )
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """
+        Check whether a stored hash was made with another cost than the configured
+        one.
+
+        Args:
+            password_hash (str): A stored bcrypt hash.
+
+        Returns:
+            bool: True if the password should be hashed again.
+        """
+        return hash_cost(password_hash) != self.rounds
+
+    def stats(self) -> Dict:
+        """
+        Report the queue depth and the hash latencies, queueing included.
+
+        Returns:
+            Dict: Worker and queue sizes, calls running and queued, completed and
+                rejected counts, average/maximum latency and the latency histogram.
+        """
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": min(self._in_flight, self.workers),
+            "queued": max(self._in_flight - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_avg_ms": (
+                self.latency_total / self.completed * 1000 if self.completed else 0.0
+            ),
+            "latency_max_ms": self.latency_max * 1000,
+            "latency_histogram": histogram(self.buckets),
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes, if they were started.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+    queue_size=settings.PASSWORD_HASH_QUEUE_SIZE,
+    retry_after=settings.PASSWORD_HASH_RETRY_AFTER,
+)
@@ -1,15 +1,90 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import crud, database
+from app.compression import CompressionMiddleware
 from app.config import settings
-from app.routers import challenges, daily_logs, shared_challenges, users
+from app.hashing import HasherBusy, password_hasher
+from app.routers import challenges, daily_logs, internal, shared_challenges, users
+from app.serialization import FastJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+async def reload_revocations() -> None:
+    """
+    Keep the token deny-list in sync with the `revoked_tokens` table, picking up
+    the revocations made by other processes every REVOCATION_RELOAD_SECONDS.
+    """
+    while True:
+        await asyncio.sleep(settings.REVOCATION_RELOAD_SECONDS)
+        try:
+            async with database.primary.session() as db:
+                await crud.load_revocations(db)
+                await crud.delete_expired_revocations(db)
+        except Exception:
+            # Keep the revocations loaded so far and retry on the next interval
+            logger.exception("Reloading the token revocations failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load the token deny-list before serving and reload it in the background,
+    release the application's worker processes on shutdown.
+
+    A deny-list that cannot be loaded, e.g. because the `revoked_tokens` table is
+    missing until `python -m app.migrations upgrade` runs, is logged and left
+    empty: the app starts, and the background reload retries.
+    """
+    try:
+        async with database.primary.session() as db:
+            await crud.load_revocations(db)
+    except SQLAlchemyError:
+        logger.exception(
+            "Loading the token revocations failed, starting with an empty "
+            "deny-list: have the migrations been applied?"
+        )
+    reloader = asyncio.create_task(reload_revocations())
+    yield
+    reloader.cancel()
+    with suppress(asyncio.CancelledError):
+        await reloader
+    password_hasher.shutdown()
+
 
 # Initialize the FastAPI application
 app = FastAPI(
     title="Daily Task Tracker API",
     description="An API for managing daily progress on personal challenges",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+# gzip responses above COMPRESSION_MIN_SIZE for clients accepting it
+app.add_middleware(CompressionMiddleware)
+
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy) -> JSONResponse:
+    """
+    Turn a full password hashing queue into a 503 the client can retry.
+
+    Returns:
+        JSONResponse: 503 response with a `Retry-After` header.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many sign-ins in progress, retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 # Include API routers
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
@@ -20,6 +95,9 @@ app.include_router(
     prefix="/api/v1/shared-challenges",
     tags=["Shared Challenges"],
 )
+app.include_router(
+    internal.router, prefix="/internal", tags=["Internal"], include_in_schema=False
+)
 
 
 @app.get("/")
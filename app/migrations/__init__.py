@@ -0,0 +1,149 @@
+"""
+Versioned schema migrations.
+
+Each module in `app.migrations.versions` is one migration. Its name starts with
+the version (`v0001_...`) and it defines `DESCRIPTION` and `upgrade(connection)`.
+Applied versions are recorded in the `schema_migrations` table, so running
+`python -m app.migrations upgrade` only applies what is pending.
+
+A database without any application table is created from the ORM models and
+stamped with every known version instead of replaying the migrations.
+"""
+
+import importlib
+import pkgutil
+from types import ModuleType
+from typing import List, Optional, Set
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, inspect
+from sqlalchemy.engine import Connection, Engine
+
+from app.migrations import versions
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+migrations_metadata = MetaData()
+schema_migrations = Table(
+    MIGRATIONS_TABLE,
+    migrations_metadata,
+    Column("version", String(32), primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), default=func.now(), nullable=False),
+)
+
+
+class MigrationError(Exception):
+    """
+    Raised when a migration cannot be applied safely.
+    """
+
+
+def discover() -> List[ModuleType]:
+    """
+    Load every migration module, ordered by version.
+
+    Returns:
+        List[ModuleType]: The migration modules.
+    """
+    names = sorted(
+        module.name
+        for module in pkgutil.iter_modules(versions.__path__)
+        if module.name.startswith("v")
+    )
+    return [importlib.import_module(f"{versions.__name__}.{name}") for name in names]
+
+
+def version_of(migration: ModuleType) -> str:
+    """
+    Extract the version of a migration from its module name.
+
+    Args:
+        migration (ModuleType): A module returned by `discover()`.
+
+    Returns:
+        str: The version, e.g. `0001` for `v0001_hot_filter_indexes`.
+    """
+    return migration.__name__.rsplit(".", 1)[-1].split("_", 1)[0][1:]
+
+
+def applied_versions(connection: Connection) -> Set[str]:
+    """
+    Read the versions already applied to the database.
+
+    Args:
+        connection (Connection): Connection to the target database.
+
+    Returns:
+        Set[str]: The applied versions.
+    """
+    migrations_metadata.create_all(connection)
+    return set(connection.execute(schema_migrations.select()).scalars())
+
+
+def _record(connection: Connection, migration: ModuleType) -> None:
+    connection.execute(
+        schema_migrations.insert().values(
+            version=version_of(migration), description=migration.DESCRIPTION
+        )
+    )
+
+
+def upgrade(engine: Engine, target: Optional[str] = None) -> List[str]:
+    """
+    Apply pending migrations in version order.
+
+    Args:
+        engine (Engine): Sync engine of the target database.
+        target (str, optional): Stop after this version instead of the latest one.
+
+    Returns:
+        List[str]: The versions applied (or stamped) by this call.
+    """
+    # Imported here so `app.database` can import this package without a cycle
+    from app.database import Base
+
+    migrations = discover()
+    if target is not None:
+        migrations = [m for m in migrations if version_of(m) <= target]
+
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+        if not done and not inspect(connection).has_table("users"):
+            # Fresh database: the models already describe the latest schema
+            Base.metadata.create_all(connection)
+            for migration in migrations:
+                _record(connection, migration)
+            return [version_of(migration) for migration in migrations]
+
+    applied = []
+    for migration in migrations:
+        if version_of(migration) in done:
+            continue
+        # One connection per migration: DDL commits implicitly on MySQL anyway
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            _record(connection, migration)
+        applied.append(version_of(migration))
+    return applied
+
+
+def status(engine: Engine) -> List[dict]:
+    """
+    List every known migration and whether it has been applied.
+
+    Args:
+        engine (Engine): Sync engine of the target database.
+
+    Returns:
+        List[dict]: Version, description and applied flag per migration.
+    """
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    return [
+        {
+            "version": version_of(migration),
+            "description": migration.DESCRIPTION,
+            "applied": version_of(migration) in done,
+        }
+        for migration in discover()
+    ]
@@ -0,0 +1,33 @@
+"""
+Command line entry point for the schema migrations.
+
+Usage:
+    python -m app.migrations upgrade [--target VERSION]
+    python -m app.migrations status
+"""
+
+import argparse
+
+from app import migrations
+from app.database import engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", help="Last version to apply")
+    commands.add_parser("status", help="List migrations and whether they are applied")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        applied = migrations.upgrade(engine, target=args.target)
+        print(f"Applied: {', '.join(applied)}" if applied else "Already up to date")
+    else:
+        for migration in migrations.status(engine):
+            state = "applied" if migration["applied"] else "pending"
+            print(f"{migration['version']}  {state:<8} {migration['description']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from typing import Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from app.migrations import MigrationError
+
+
+def has_index(connection: Connection, table: str, columns: Sequence[str]) -> bool:
+    """
+    Check whether an index or unique constraint already covers exactly `columns`.
+
+    Matching by columns rather than name also recognises indexes created by
+    `init.sql`, whose names MySQL generated.
+
+    Args:
+        connection (Connection): Connection to the target database.
+        table (str): Table name.
+        columns (Sequence[str]): Indexed columns, in order.
+
+    Returns:
+        bool: True if such an index exists.
+    """
+    inspector = inspect(connection)
+    existing = inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+    return any(list(index["column_names"]) == list(columns) for index in existing)
+
+
+def ensure_unique(connection: Connection, table: str, columns: Sequence[str]) -> None:
+    """
+    Fail early if existing rows would violate a unique index on `columns`.
+
+    Args:
+        connection (Connection): Connection to the target database.
+        table (str): Table name.
+        columns (Sequence[str]): Columns that must be unique together.
+
+    Raises:
+        MigrationError: If duplicate rows exist, listing a few of them.
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    column_list = ", ".join(quote(column) for column in columns)
+    duplicates = connection.execute(
+        text(
+            f"SELECT {column_list}, COUNT(*) FROM {quote(table)} "
+            f"GROUP BY {column_list} HAVING COUNT(*) > 1 LIMIT 5"
+        )
+    ).all()
+    if duplicates:
+        raise MigrationError(
+            f"Cannot add a unique index on {table}({', '.join(columns)}), "
+            f"duplicate rows exist: {[tuple(row) for row in duplicates]}"
+        )
+
+
+def create_index_online(
+    connection: Connection,
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    unique: bool = False,
+) -> bool:
+    """
+    Create an index without blocking writes to the table while it builds.
+
+    MySQL builds it in place with `ALGORITHM=INPLACE, LOCK=NONE` and PostgreSQL
+    with `CREATE INDEX CONCURRENTLY` on an autocommit connection. Other dialects
+    fall back to a plain `CREATE INDEX`.
+
+    Args:
+        connection (Connection): Connection to the target database.
+        name (str): Name of the new index.
+        table (str): Table name.
+        columns (Sequence[str]): Indexed columns, in order.
+        unique (bool, optional): Create a unique index.
+
+    Returns:
+        bool: False if an equivalent index already existed, True otherwise.
+
+    Raises:
+        MigrationError: If `unique` is set and existing rows are duplicated.
+    """
+    if has_index(connection, table, columns):
+        return False
+    if unique:
+        ensure_unique(connection, table, columns)
+
+    quote = connection.dialect.identifier_preparer.quote
+    column_list = ", ".join(quote(column) for column in columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    dialect = connection.dialect.name
+
+    if dialect == "mysql":
+        connection.execute(
+            text(
+                f"ALTER TABLE {quote(table)} ADD {kind} {quote(name)} ({column_list}), "
+                "ALGORITHM=INPLACE, LOCK=NONE"
+            )
+        )
+    elif dialect == "postgresql":
+        # CONCURRENTLY cannot run inside the migration's transaction
+        with connection.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as autocommit:
+            autocommit.execute(
+                text(
+                    f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {quote(name)} "
+                    f"ON {quote(table)} ({column_list})"
+                )
+            )
+    else:
+        connection.execute(
+            text(
+                f"CREATE {kind} IF NOT EXISTS {quote(name)} "
+                f"ON {quote(table)} ({column_list})"
+            )
+        )
+    return True
@@ -0,0 +1,3 @@
+"""
+Migration modules, applied in the order of their `vNNNN_` prefix.
+"""
@@ -0,0 +1,35 @@
+from sqlalchemy.engine import Connection
+
+from app.migrations.operations import create_index_online
+
+DESCRIPTION = "Indexes and unique constraints for the hot query filters"
+
+
+def upgrade(connection: Connection) -> None:
+    """
+    Index `challenges(user_id, name)`, `daily_logs(challenge_id, log_date)` and
+    `shared_challenges(shared_user_id)`.
+
+    Args:
+        connection (Connection): Connection to the target database.
+    """
+    create_index_online(
+        connection,
+        "uq_challenges_user_id_name",
+        "challenges",
+        ["user_id", "name"],
+        unique=True,
+    )
+    create_index_online(
+        connection,
+        "uq_daily_logs_challenge_id_log_date",
+        "daily_logs",
+        ["challenge_id", "log_date"],
+        unique=True,
+    )
+    create_index_online(
+        connection,
+        "ix_shared_challenges_shared_user_id",
+        "shared_challenges",
+        ["shared_user_id"],
+    )
@@ -0,0 +1,20 @@
+from sqlalchemy.engine import Connection
+
+from app.migrations.operations import create_index_online
+
+DESCRIPTION = "Index for paginating a user's challenges by start date"
+
+
+def upgrade(connection: Connection) -> None:
+    """
+    Index `challenges(user_id, started_at)`, the keyset of the challenge listing.
+
+    Args:
+        connection (Connection): Connection to the target database.
+    """
+    create_index_online(
+        connection,
+        "ix_challenges_user_id_started_at",
+        "challenges",
+        ["user_id", "started_at"],
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+from sqlalchemy.engine import Connection
+
+DESCRIPTION = "Table of revoked access tokens"
+
+# The table as of this version, independent of later changes to the models. No
+# foreign key, as the type of `users.id` differs between init.sql and the models
+metadata = MetaData()
+revoked_tokens = Table(
+    "revoked_tokens",
+    metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("jti", String(32), nullable=True),
+    Column("user_id", BigInteger, nullable=False),
+    Column("issued_before_ms", BigInteger, nullable=True),
+    Column("revoked_at", DateTime(timezone=True), nullable=False),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+    Index("ix_revoked_tokens_expires_at", "expires_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    """
+    Create `revoked_tokens`, unless `init.sql` already did.
+
+    Args:
+        connection (Connection): Connection to the target database.
+    """
+    revoked_tokens.create(connection, checkfirst=True)
@@ -1,4 +1,5 @@
 -- Drop tables if they already exist to prevent conflicts during creation
+DROP TABLE IF EXISTS revoked_tokens;
 DROP TABLE IF EXISTS shared_challenges;
 DROP TABLE IF EXISTS daily_logs;
 DROP TABLE IF EXISTS challenges;
@@ -22,6 +23,8 @@ CREATE TABLE challenges (
     description TEXT,
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
     completed_at TIMESTAMP,
+    UNIQUE KEY uq_challenges_user_id_name (user_id, name),
+    INDEX ix_challenges_user_id_started_at (user_id, started_at),
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -33,7 +36,7 @@ CREATE TABLE daily_logs (
     completed BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    UNIQUE (challenge_id, log_date),
+    UNIQUE KEY uq_daily_logs_challenge_id_log_date (challenge_id, log_date),
     FOREIGN KEY (challenge_id) REFERENCES challenges(id) ON DELETE CASCADE
 );
 
@@ -43,6 +46,20 @@ CREATE TABLE shared_challenges (
     challenge_id BIGINT UNSIGNED NOT NULL,
     shared_user_id BIGINT UNSIGNED NOT NULL,
     shared_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    INDEX ix_shared_challenges_shared_user_id (shared_user_id),
     FOREIGN KEY (challenge_id) REFERENCES challenges(id) ON DELETE CASCADE,
     FOREIGN KEY (shared_user_id) REFERENCES users(id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Create the revoked_tokens table
+CREATE TABLE revoked_tokens (
+    id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    jti VARCHAR(32) NULL,
+    user_id BIGINT UNSIGNED NOT NULL,
+    issued_before_ms BIGINT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    INDEX ix_revoked_tokens_revoked_at (revoked_at),
+    INDEX ix_revoked_tokens_expires_at (expires_at),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
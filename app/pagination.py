@@ -0,0 +1,193 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Request, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import ColumnElement, Select
+
+from app.config import settings
+
+# Response header carrying the cursor of the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Response headers announcing a next page, `Link` with its URL as `rel="next"`
+NEXT_PAGE_HEADERS = (NEXT_CURSOR_HEADER, "Link")
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    """
+    One page of a list ordered by `(sort key, id)`.
+
+    Attributes:
+        limit (int): Rows to return, already capped at `PAGE_SIZE_MAX`.
+        after (Optional[Tuple[datetime, int]]): Sort key and id of the last row of
+            the previous page, None for the first page.
+        start (Optional[datetime]): Inclusive lower bound of the sort key.
+        end (Optional[datetime]): Exclusive upper bound of the sort key.
+    """
+
+    limit: int
+    after: Optional[Tuple[datetime, int]] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """
+    Build the opaque cursor pointing just past a row.
+
+    Args:
+        sort_value (datetime): The row's sort key.
+        row_id (int): The row's ID, breaking ties between equal sort keys.
+
+    Returns:
+        str: URL-safe cursor.
+    """
+    payload = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Read back a cursor built by `encode_cursor`.
+
+    Args:
+        cursor (str): Cursor received from a client.
+
+    Returns:
+        Tuple[datetime, int]: Sort key and ID of the row the cursor points past.
+
+    Raises:
+        ValueError: If the cursor was not built by `encode_cursor`.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(row_id, int):
+            raise ValueError("cursor id is not an integer")
+        return datetime.fromisoformat(sort_value), row_id
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as error:
+        raise ValueError(f"Malformed cursor: {cursor!r}") from error
+
+
+def page_request(
+    limit: Optional[int] = Query(
+        None, ge=1, description=f"Page size, at most {settings.PAGE_SIZE_MAX}."
+    ),
+    cursor: Optional[str] = Query(
+        None, description=f"Value of the previous page's {NEXT_CURSOR_HEADER} header."
+    ),
+    start: Optional[date] = Query(
+        None, alias="from", description="Earliest day to include."
+    ),
+    end: Optional[date] = Query(None, alias="to", description="Latest day to include."),
+) -> PageRequest:
+    """
+    Dependency parsing the pagination query parameters of a list endpoint.
+
+    A request without `limit` gets a page of `PAGE_SIZE_MAX` rows. This is a
+    breaking change for clients that expect these endpoints to return the whole
+    list: past `PAGE_SIZE_MAX` rows they get the first page only. Such clients
+    must follow the next page, announced both by `X-Next-Cursor` and by a
+    standard `Link: <url>; rel="next"` header.
+
+    Args:
+        limit (int, optional): Requested page size, capped at `PAGE_SIZE_MAX`.
+        cursor (str, optional): Cursor of the page to fetch.
+        start (date, optional): Earliest day to include (`from`).
+        end (date, optional): Latest day to include (`to`).
+
+    Returns:
+        PageRequest: The page to fetch.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor"
+        )
+    return PageRequest(
+        limit=min(limit or settings.PAGE_SIZE_MAX, settings.PAGE_SIZE_MAX),
+        after=after,
+        start=datetime.combine(start, time.min) if start is not None else None,
+        end=(
+            datetime.combine(end + timedelta(days=1), time.min)
+            if end is not None
+            else None
+        ),
+    )
+
+
+def paginate(
+    query: Select, page: PageRequest, sort_column: ColumnElement, id_column
+) -> Select:
+    """
+    Restrict a query to one page, ordered by `(sort_column, id_column)`.
+
+    The conditions only compare the sort key and id, so an index ending in
+    `(sort_column)` after the query's equality filters serves both the range scan
+    and the ordering. One extra row is fetched to tell whether a next page exists.
+
+    Args:
+        query (Select): Query selecting the listed rows.
+        page (PageRequest): The page to fetch.
+        sort_column (ColumnElement): Sort key of the listing.
+        id_column (ColumnElement): Primary key, breaking ties in the sort key.
+
+    Returns:
+        Select: The query for the page, fetching up to `page.limit + 1` rows.
+    """
+    if page.start is not None:
+        query = query.where(sort_column >= page.start)
+    if page.end is not None:
+        query = query.where(sort_column < page.end)
+    if page.after is not None:
+        sort_value, row_id = page.after
+        query = query.where(
+            or_(
+                sort_column > sort_value,
+                and_(sort_column == sort_value, id_column > row_id),
+            )
+        )
+    return query.order_by(sort_column, id_column).limit(page.limit + 1)
+
+
+def finish_page(
+    rows: Sequence,
+    page: PageRequest,
+    response: Response,
+    sort_attribute: str,
+    request: Request,
+) -> List:
+    """
+    Trim the extra row fetched by `paginate` and announce the next page, by its
+    cursor in `X-Next-Cursor` and by its URL in a `Link` header.
+
+    Args:
+        rows (Sequence): Rows returned by the paginated query.
+        page (PageRequest): The page that was fetched.
+        response (Response): Response receiving the `NEXT_PAGE_HEADERS`.
+        sort_attribute (str): Name of the sort key attribute on the rows.
+        request (Request): The request for the page, whose URL the next page's
+            is derived from.
+
+    Returns:
+        List: At most `page.limit` rows.
+    """
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]
+        cursor = encode_cursor(getattr(last, sort_attribute), last.id)
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+        next_url = request.url.include_query_params(cursor=cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return rows
@@ -0,0 +1,163 @@
+import threading
+import time
+from typing import Dict, List, Type
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+
+# Upper bounds (in milliseconds) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def wait_bucket(seconds: float) -> int:
+    """
+    Find the `WAIT_BUCKETS_MS` bucket of a duration.
+
+    Args:
+        seconds (float): The measured duration.
+
+    Returns:
+        int: Index of the first bucket bounding it, `len(WAIT_BUCKETS_MS)` above all.
+    """
+    waited_ms = seconds * 1000
+    return next(
+        (i for i, bound in enumerate(WAIT_BUCKETS_MS) if waited_ms <= bound),
+        len(WAIT_BUCKETS_MS),
+    )
+
+
+def histogram(buckets: List[int]) -> Dict[str, int]:
+    """
+    Label the counts of a `WAIT_BUCKETS_MS` histogram.
+
+    Args:
+        buckets (List[int]): Counts per bucket, as indexed by `wait_bucket`.
+
+    Returns:
+        Dict[str, int]: Counts keyed by `le_<bound>ms`, plus `gt_<largest bound>ms`.
+    """
+    labelled = {
+        f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, buckets)
+    }
+    labelled["gt_%dms" % WAIT_BUCKETS_MS[-1]] = buckets[-1]
+    return labelled
+
+
+class PoolStats:
+    """
+    Collects how long callers wait to check a connection out of a pool.
+
+    Attributes:
+        checkouts (int): Number of completed checkouts.
+        timeouts (int): Number of checkouts that gave up after `pool_timeout`.
+        wait_total (float): Sum of all checkout waits, in seconds.
+        wait_max (float): Longest checkout wait seen, in seconds.
+        buckets (List[int]): Checkout counts per `WAIT_BUCKETS_MS` bucket, the last
+            entry counting waits above the largest bound.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.buckets: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, seconds: float) -> None:
+        """
+        Record the wait of one successful checkout.
+
+        Args:
+            seconds (float): Time spent inside the pool's checkout.
+        """
+        bucket = wait_bucket(seconds)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.buckets[bucket] += 1
+
+    def record_timeout(self) -> None:
+        """
+        Record a checkout that timed out waiting for a connection.
+        """
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict:
+        """
+        Return the collected wait statistics.
+
+        Returns:
+            Dict: Checkout counts, average/maximum wait and the wait histogram.
+        """
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": (
+                    self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0
+                ),
+                "wait_max_ms": self.wait_max * 1000,
+                "wait_histogram": histogram(self.buckets),
+            }
+
+
+def instrumented_pool_class(pool_class: Type[Pool], stats: PoolStats) -> Type[Pool]:
+    """
+    Derive a pool class that reports checkout waits to `stats`.
+
+    The statistics live on the class, so they survive `Pool.recreate()` which
+    builds the replacement pool from `self.__class__`.
+
+    Args:
+        pool_class (Type[Pool]): The pool class the dialect would use by default.
+        stats (PoolStats): Collector receiving the checkout waits.
+
+    Returns:
+        Type[Pool]: Subclass of `pool_class` timing every checkout.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = pool_class._do_get(self)
+        except PoolTimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(
+        f"Instrumented{pool_class.__name__}",
+        (pool_class,),
+        {"stats": stats, "_do_get": _do_get},
+    )
+
+
+def describe_pool(pool: Pool) -> Dict:
+    """
+    Report the live state of a connection pool.
+
+    Args:
+        pool (Pool): The engine's pool (`engine.pool`).
+
+    Returns:
+        Dict: Occupancy of the pool plus the checkout wait statistics if the pool
+            was built by `instrumented_pool_class`.
+    """
+    status: Dict = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow_in_use=max(pool.overflow(), 0),
+        )
+    stats = getattr(pool, "stats", None)
+    if isinstance(stats, PoolStats):
+        status.update(stats.snapshot())
+    return status
@@ -0,0 +1,178 @@
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from fastapi import Request
+
+from app.config import settings
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # key -> (tokens left, time of the last refill)
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by an arbitrary string (a username, a client IP).
+
+    Each key may spend `burst` attempts at once and regains `rate` attempts per
+    second. Keys are spread over independent shards, each with its own small lock,
+    so concurrent callers rarely contend. Each shard keeps its least recently used
+    keys up to `max_keys / shards`; an evicted key starts again with a full bucket.
+
+    Attributes:
+        name (str): Label of the limiter in the metrics.
+        rate (float): Attempts regained per second.
+        burst (float): Bucket capacity.
+        allowed (int): Attempts let through.
+        rejected (int): Attempts refused.
+    """
+
+    def __init__(
+        self, name: str, rate: float, burst: float, shards: int, max_keys: int
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._shards: List[_Shard] = [_Shard() for _ in range(shards)]
+        self._keys_per_shard = max(max_keys // shards, 1)
+        self.allowed = 0
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        """
+        Spend one attempt from the key's bucket.
+
+        Args:
+            key (str): The rate-limited identity.
+
+        Returns:
+            float: 0 if the attempt is allowed, otherwise the seconds until the
+                bucket holds an attempt again.
+        """
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            tokens, updated = shard.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            shard.buckets[key] = (tokens, now)
+            if len(shard.buckets) > self._keys_per_shard:
+                shard.buckets.popitem(last=False)
+
+        # Counters are approximate under threads, they only feed the metrics
+        if allowed:
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (1 - tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def stats(self) -> Dict:
+        """
+        Report the limiter's settings and counters.
+
+        Returns:
+            Dict: Rate, burst, allowed and rejected attempts and keys tracked.
+        """
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "tracked_keys": sum(len(shard.buckets) for shard in self._shards),
+        }
+
+
+def _per_minute(name: str, per_minute: float, burst: float) -> RateLimiter:
+    return RateLimiter(
+        name,
+        rate=per_minute / 60,
+        burst=burst,
+        shards=settings.LOGIN_LIMIT_SHARDS,
+        max_keys=settings.LOGIN_LIMIT_MAX_KEYS,
+    )
+
+
+# Login attempts per client IP and per username, checked before any other work
+login_limiters = (
+    _per_minute("client_ip", settings.LOGIN_IP_PER_MINUTE, settings.LOGIN_IP_BURST),
+    _per_minute(
+        "username", settings.LOGIN_USERNAME_PER_MINUTE, settings.LOGIN_USERNAME_BURST
+    ),
+)
+
+
+def admit_login(client_ip: str, username: str) -> float:
+    """
+    Charge a login attempt to the client IP, then to the username.
+
+    An attempt refused by the IP limiter is not charged to the username, so a
+    flood refused per address does not also drain the targeted accounts.
+
+    Args:
+        client_ip (str): Address of the client.
+        username (str): Username being logged into, compared case-insensitively.
+
+    Returns:
+        float: 0 if the attempt may proceed, otherwise seconds to wait.
+    """
+    ip_limiter, username_limiter = login_limiters
+    retry_after = ip_limiter.acquire(client_ip)
+    if retry_after:
+        return retry_after
+    return username_limiter.acquire(username.lower())
+
+
+# Proxies whose `X-Forwarded-For` entries are believed
+trusted_proxies = tuple(
+    ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES
+)
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Find the address of the client behind a request.
+
+    A request from one of TRUSTED_PROXIES is attributed to the last address its
+    `X-Forwarded-For` chain lists that is not itself a trusted proxy: the one the
+    outermost trusted proxy saw connecting. Addresses further left were written by
+    the client and are ignored, so a client cannot pick the IP it is charged to.
+
+    Args:
+        request (Request): The incoming request.
+
+    Returns:
+        str: The client's address, "unknown" if the server could not tell.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(address):
+        return address
+    forwarded = [
+        hop.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for hop in header.split(",")
+    ]
+    for hop in reversed(forwarded):
+        if not hop:
+            continue
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
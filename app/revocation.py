@@ -0,0 +1,196 @@
+import math
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.schemas import TokenData
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership test that may answer "maybe" for keys never added,
+    but never "no" for a key that was.
+
+    Attributes:
+        capacity (int): Keys the filter is sized for.
+        size (int): Bits in the filter.
+        hashes (int): Bits set per key.
+        count (int): Keys added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _hash(self, key: str) -> Tuple[int, int]:
+        # Double hashing: k positions derived from the two halves of one hash. The
+        # built-in hash is salted per process, which suits a filter never persisted
+        digest = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return digest >> 32, (digest & 0xFFFFFFFF) | 1
+
+    def add(self, key: str) -> None:
+        """
+        Add a key to the filter.
+
+        Args:
+            key (str): The key.
+        """
+        first, step = self._hash(key)
+        for index in range(self.hashes):
+            position = (first + index * step) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        # Stops at the first unset bit, usually the first one for an absent key
+        first, step = self._hash(key)
+        for index in range(self.hashes):
+            position = (first + index * step) % self.size
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    In-memory deny-list of revoked tokens, mirroring the `revoked_tokens` table.
+
+    A token is revoked either by its `jti`, or by a cutoff revoking every token of
+    its user issued before a point in time. Checking a token never touches the
+    database: the Bloom filter rules out almost every token that was never revoked,
+    and the exact map confirms the rare filter hits.
+
+    Rows are applied as they are written by this process, and loaded incrementally
+    from the table by `crud.load_revocations` for those written by other processes.
+    Entries are forgotten once the tokens they revoke have expired anyway. Only used
+    from the event loop, so no locking is needed.
+
+    Attributes:
+        last_id (int): Highest `revoked_tokens.id` applied so far.
+        bloom_rebuilds (int): Times the Bloom filter was rebuilt.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        # jti -> expiry of the token, as a UNIX timestamp
+        self._tokens: Dict[str, float] = {}
+        # user id -> (tokens issued before this UNIX timestamp are revoked, expiry)
+        self._cutoffs: Dict[int, Tuple[float, float]] = {}
+        self.last_id = 0
+        self.bloom_rebuilds = 0
+
+    def is_revoked(self, principal: TokenData) -> bool:
+        """
+        Check a verified token against the deny-list.
+
+        Args:
+            principal (TokenData): The token's principal.
+
+        Returns:
+            bool: True if the token was revoked.
+        """
+        cutoff = self._cutoffs.get(principal.id)
+        if cutoff is not None and principal.issued_at < cutoff[0]:
+            return True
+        jti = principal.jti
+        return jti is not None and jti in self._bloom and jti in self._tokens
+
+    def revoke_token(self, jti: str, expires_at: float) -> None:
+        """
+        Revoke a single token.
+
+        Args:
+            jti (str): The token's unique identifier.
+            expires_at (float): The token's expiry, as a UNIX timestamp.
+        """
+        if jti in self._tokens:
+            return
+        self._tokens[jti] = expires_at
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild_bloom()
+        else:
+            self._bloom.add(jti)
+
+    def revoke_user(
+        self, user_id: int, issued_before: float, expires_at: float
+    ) -> None:
+        """
+        Revoke every token of a user issued before a point in time.
+
+        Args:
+            user_id (int): Unique identifier of the user.
+            issued_before (float): Cutoff, as a UNIX timestamp.
+            expires_at (float): When every token issued before the cutoff has
+                expired, as a UNIX timestamp.
+        """
+        current = self._cutoffs.get(user_id)
+        if current is None or current[0] < issued_before:
+            self._cutoffs[user_id] = (issued_before, expires_at)
+
+    def apply(self, rows: Iterable) -> None:
+        """
+        Apply rows of the `revoked_tokens` table. Applying a row twice is harmless.
+
+        Args:
+            rows (Iterable[RevokedToken]): The rows.
+        """
+        for row in rows:
+            expires_at = row.expires_at.timestamp()
+            if row.jti is not None:
+                self.revoke_token(row.jti, expires_at)
+            else:
+                self.revoke_user(row.user_id, row.issued_before_ms / 1000, expires_at)
+            self.last_id = max(self.last_id, row.id)
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """
+        Forget the entries whose tokens have all expired. The Bloom filter keeps
+        their bits until its next rebuild, costing only extra exact-map lookups.
+
+        Args:
+            now (float, optional): Current UNIX timestamp.
+        """
+        now = time.time() if now is None else now
+        for jti in [jti for jti, expiry in self._tokens.items() if expiry <= now]:
+            del self._tokens[jti]
+        for user_id in [
+            user_id for user_id, (_, expiry) in self._cutoffs.items() if expiry <= now
+        ]:
+            del self._cutoffs[user_id]
+
+    def _rebuild_bloom(self) -> None:
+        self.prune()
+        self._bloom = BloomFilter(
+            max(self._capacity, 2 * len(self._tokens)), self._error_rate
+        )
+        for jti in self._tokens:
+            self._bloom.add(jti)
+        self.bloom_rebuilds += 1
+
+    def stats(self) -> Dict:
+        """
+        Report the size of the deny-list.
+
+        Returns:
+            Dict: Revoked tokens and user cutoffs held, the Bloom filter's size and
+                load, and the last table row applied.
+        """
+        return {
+            "revoked_tokens": len(self._tokens),
+            "revoked_users": len(self._cutoffs),
+            "bloom_capacity": self._bloom.capacity,
+            "bloom_keys": self._bloom.count,
+            "bloom_bits": self._bloom.size,
+            "bloom_rebuilds": self.bloom_rebuilds,
+            "last_id": self.last_id,
+        }
+
+
+revocations = RevocationList(
+    settings.REVOCATION_BLOOM_CAPACITY, settings.REVOCATION_BLOOM_ERROR_RATE
+)
@@ -1,11 +1,15 @@
-from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
-from app import database, schemas
+from app import crud, database, schemas
+from app.cache import cached_read, challenge_list_cache, user_tag
+from app.coalescing import challenge_list_flight, coalesced
+from app.conditional import is_not_modified, make_validators, not_modified
+from app.fieldsets import Fieldset, columns, fields_query, serializer
+from app.pagination import NEXT_PAGE_HEADERS, PageRequest, finish_page, page_request
 from app.schemas import TokenData
+from app.serialization import RowsResponse
 from app.utils import verify_token
 
 # Initialize the router
@@ -15,100 +19,148 @@ router = APIRouter()
 @router.post(
     "/", response_model=schemas.ChallengeResponse, status_code=status.HTTP_201_CREATED
 )
-def create_challenge(
+async def create_challenge(
     challenge: schemas.ChallengeCreate,
     current_user: TokenData = Depends(verify_token),
-    db: Session = Depends(database.get_db),
+    db: database.DBSession = Depends(database.get_write_db),
 ) -> database.Challenge:
     """
     Create a new challenge for a user.
 
     Args:
         challenge (schemas.ChallengeCreate): Data needed to create a challenge.
-        db (Session, optional): SQLAlchemy database session dependency.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.ChallengeResponse: Details of the newly created challenge.
     """
-    # Check if user with the same username or email already exists
-    existing_challenge = (
-        db.query(database.Challenge)
-        .filter(
-            (database.Challenge.user_id == current_user.id),
-            (database.Challenge.name == challenge.name),
-        )
-        .first()
-    )
-
-    if existing_challenge:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="A challenge with this name already exists for the user.",
-        )
-
-    # Create the new challenge
+    # Create the new challenge, the unique (user_id, name) index rejects duplicates
     new_challenge = database.Challenge(
         user_id=current_user.id,
         name=challenge.name,
         description=challenge.description,
-        started_at=datetime.now(),
+        started_at=database.timestamp_now(),
     )
-    db.add(new_challenge)
-    db.commit()
-    db.refresh(new_challenge)
+    if not await crud.create_challenge(db, new_challenge):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A challenge with this name already exists for the user.",
+        )
 
     return new_challenge
 
 
+# Parses the `fields` of challenge reads
+challenge_fields = fields_query(schemas.ChallengeResponse)
+
+
 @router.get("/id_{challenge_id}", response_model=schemas.ChallengeResponse)
-def get_challenge(
+async def get_challenge(
     challenge_id: int,
+    fields: Fieldset = Depends(challenge_fields),
     current_user: TokenData = Depends(verify_token),
-    db: Session = Depends(database.get_db),
-) -> database.Challenge:
+    db: database.DBSession = Depends(database.get_read_db),
+) -> Response:
     """
-    Retrieve details of a specific challenge by ID.
+    Retrieve details of one of the authenticated user's challenges by ID.
 
     Args:
         challenge_id (int): Unique identifier of the challenge.
-        db (Session, optional): SQLAlchemy database session dependency.
+        fields (Fieldset): Fields to return, only their columns are selected.
+        current_user (TokenData): The authenticated user.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
-        schemas.ChallengeResponse: Details of the challenge for the specified ID.
+        Response: Details of the challenge for the specified ID as JSON.
 
     Raises:
-        HTTPException: If the challenge with the specified ID is not found.
+        HTTPException: 404 if the challenge is not found, 403 if it belongs to
+            another user.
     """
-    challenge = (
-        db.query(database.Challenge)
-        .filter(database.Challenge.id == challenge_id)
-        .first()
+    challenge = await crud.get_owned_challenge(
+        db,
+        challenge_id,
+        current_user.id,
+        columns=columns(database.Challenge, fields) if fields else None,
     )
-    if not challenge:
+    if challenge is None:
+        # Nothing matched, tell a missing challenge apart from someone else's
+        if not await crud.challenge_exists(db, challenge_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found"
+            )
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorized to access this challenge",
         )
-    return challenge
+    body = serializer(schemas.ChallengeResponse, fields).dump_objects([challenge])[0]
+    return Response(body, media_type="application/json")
 
 
 @router.get("/all_challenges", response_model=List[schemas.ChallengeResponse])
-def get_challenges_by_user(
+@cached_read(
+    challenge_list_cache,
+    tags=lambda current_user, **_: [
+        user_tag(current_user.id),
+        user_tag(current_user.id, "challenges"),
+    ],
+    compress=True,
+)
+@coalesced(challenge_list_flight)
+async def get_challenges_by_user(
+    request: Request,
+    page: PageRequest = Depends(page_request),
+    fields: Fieldset = Depends(challenge_fields),
     current_user: TokenData = Depends(verify_token),
-    db: Session = Depends(database.get_db),
-) -> List[database.Challenge]:
+) -> Response:
     """
-    Retrieve all challenges for a specific user by their user ID.
+    Retrieve the authenticated user's challenges, one page at a time, ordered by
+    start date. The cursor of the next page is returned in the `X-Next-Cursor`
+    header, and its URL in a `Link: <url>; rel="next"` header.
+
+    Breaking change for unpaginated clients: without `limit`, at most
+    PAGE_SIZE_MAX challenges are returned, and the rest must be fetched by
+    following the next page.
+
+    Pages are served from `challenge_list_cache` as already serialized JSON,
+    gzipped once when large enough, and this body only runs on a cache miss, once
+    for identical concurrent misses. Responses carry an `ETag` and a
+    `Last-Modified`, and a matching conditional request gets a 304 before any row
+    is loaded.
 
     Args:
-        user_id (int): Unique identifier of the user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        request (Request): The request, possibly conditional.
+        page (PageRequest): Page to fetch (`limit`, `cursor`, `from`, `to`).
+        fields (Fieldset): Fields to return, only their columns are selected.
+        current_user (TokenData): The authenticated user.
 
     Returns:
-        List[schemas.ChallengeResponse]: A list of challenges belonging to the specified user.
+        Response: A page of the user's challenges as JSON, or a 304.
     """
-    challenges = (
-        db.query(database.Challenge)
-        .filter(database.Challenge.user_id == current_user.id)
-        .all()
+    async with database.read_session(current_user.id) as db:
+        aggregates, last_modified = await crud.challenge_list_version(
+            db, current_user.id
+        )
+        validators = make_validators(request, aggregates, last_modified)
+        if is_not_modified(request, validators):
+            return not_modified(validators)
+        challenges = await crud.list_challenges(
+            db,
+            current_user.id,
+            page,
+            columns=(
+                columns(database.Challenge, fields, required=("id", "started_at"))
+                if fields
+                else None
+            ),
+        )
+
+    response = Response(media_type="application/json")
+    challenges = finish_page(challenges, page, response, "started_at", request)
+    headers = validators.headers()
+    for name in NEXT_PAGE_HEADERS:
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    return RowsResponse(
+        challenges, serializer(schemas.ChallengeResponse, fields), headers=headers
     )
-    return challenges
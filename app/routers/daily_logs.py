@@ -1,9 +1,11 @@
-from typing import List
+from typing import List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 
-from app import database, schemas, utils
+from app import coalescing, conditional, crud, database, pagination, schemas, utils
+from app.config import settings
+from app.fieldsets import Fieldset, columns, fields_query, serializer
+from app.serialization import FastJSONResponse, RowsResponse, columnar_logs
 
 # Initialize the router
 router = APIRouter()
@@ -12,100 +14,204 @@ router = APIRouter()
 @router.post(
     "/", response_model=schemas.DailyLogResponse, status_code=status.HTTP_201_CREATED
 )
-def create_daily_log(
+async def create_daily_log(
     log: schemas.DailyLogCreate,
+    on_conflict: schemas.OnConflict = schemas.OnConflict.reject,
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
-) -> database.DailyLog:
+    db: database.DBSession = Depends(database.get_write_db),
+) -> dict:
     """
     Create a daily log entry for a specific challenge.
 
+    The log is written with a single upsert statement, so concurrent check-ins
+    for the same day cannot create duplicates.
+
     Args:
         log (schemas.DailyLogCreate): Data needed to create a daily log entry.
-        db (Session, optional): SQLAlchemy database session dependency.
+        on_conflict (schemas.OnConflict, optional): `reject` (default) answers 400
+            if the day is already logged, `overwrite` replaces the existing entry.
+        current_user (schemas.TokenData): The authenticated user.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.DailyLogResponse: Details of the created daily log entry.
+
+    Raises:
+        HTTPException: If the challenge does not belong to the user or the day is
+            already logged.
     """
-    # Check if the log for the specific date and challenge already exists
-    existing_log = (
-        db.query(database.DailyLog)
-        .filter(
-            database.DailyLog.challenge_id == log.challenge_id,
-            database.DailyLog.log_date == log.log_date,
+    if not await crud.owns_challenge(db, log.challenge_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorized to add logs to this challenge.",
         )
-        .first()
+
+    new_log = await crud.upsert_daily_log(
+        db, log.challenge_id, log.log_date, log.completed, on_conflict
     )
 
-    if existing_log:
+    if new_log is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A log entry for this date already exists",
         )
 
-    new_log = database.DailyLog(
-        challenge_id=log.challenge_id, log_date=log.log_date, completed=log.completed
+    return new_log
+
+
+@router.post("/bulk", response_model=schemas.DailyLogBulkResponse)
+async def create_daily_logs_bulk(
+    logs: schemas.DailyLogBulkCreate,
+    on_conflict: schemas.OnConflict = schemas.OnConflict.reject,
+    current_user: schemas.TokenData = Depends(utils.verify_token),
+    db: database.DBSession = Depends(database.get_write_db),
+) -> dict:
+    """
+    Create many daily log entries at once, e.g. when a client syncs offline
+    check-ins or imports history from another tracker.
+
+    Ownership of all referenced challenges is checked with one query, and logs are
+    inserted with multi-row statements of `BULK_LOG_CHUNK_SIZE` rows.
+
+    Args:
+        logs (schemas.DailyLogBulkCreate): The daily log entries to create.
+        on_conflict (schemas.OnConflict, optional): `reject` (default) reports days
+            already logged as duplicates, `overwrite` replaces them.
+        current_user (schemas.TokenData): The authenticated user.
+        db (DBSession, optional): SQLAlchemy database session dependency.
+
+    Returns:
+        schemas.DailyLogBulkResponse: The outcome of every item, in request order.
+    """
+    results = await crud.bulk_upsert_daily_logs(
+        db,
+        current_user.id,
+        logs.items,
+        on_conflict,
+        chunk_size=settings.BULK_LOG_CHUNK_SIZE,
     )
-    db.add(new_log)
-    db.commit()
-    db.refresh(new_log)
 
-    return new_log
+    return {"results": results}
+
+
+# Parses the `fields` of log list reads
+log_fields = fields_query(schemas.DailyLogResponse)
+# The columnar format only needs these, read as plain rows rather than objects
+COLUMNAR_LOG_COLUMNS = (
+    database.DailyLog.id,
+    database.DailyLog.log_date,
+    database.DailyLog.completed,
+)
 
 
-@router.get("/{challenge_id}", response_model=List[schemas.DailyLogResponse])
-def get_logs_by_challenge(
+def _log_columns(
+    log_format: schemas.LogListFormat, fields: Fieldset
+) -> Optional[Tuple]:
+    # Paging needs `id` and `log_date` whatever the fields returned
+    if log_format is schemas.LogListFormat.columnar:
+        return COLUMNAR_LOG_COLUMNS
+    if fields:
+        return columns(database.DailyLog, fields, required=("id", "log_date"))
+    return None
+
+
+@router.get(
+    "/{challenge_id}",
+    response_model=Union[
+        List[schemas.DailyLogResponse], schemas.DailyLogColumnarResponse
+    ],
+)
+@coalescing.coalesced(coalescing.log_list_flight)
+async def get_logs_by_challenge(
     challenge_id: int,
+    request: Request,
+    log_format: schemas.LogListFormat = Query(
+        schemas.LogListFormat.objects, alias="format"
+    ),
+    page: pagination.PageRequest = Depends(pagination.page_request),
+    fields: Fieldset = Depends(log_fields),
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
-) -> List[database.DailyLog]:
+) -> Response:
     """
-    Retrieve all daily log entries for a specific challenge, ensuring that the
-    challenge belongs to the authenticated user.
+    Retrieve the daily log entries of a specific challenge, one page at a time in
+    date order, ensuring that the challenge belongs to the authenticated user. The
+    cursor of the next page is returned in the `X-Next-Cursor` header, and its URL
+    in a `Link: <url>; rel="next"` header.
+
+    Breaking change for unpaginated clients: without `limit`, at most
+    PAGE_SIZE_MAX logs are returned, and the rest must be fetched by following the
+    next page.
+
+    With `format=columnar`, the page is sent as a single object holding its first
+    day, run lengths of the logged and completed days and the log ids, a fraction
+    of the size of one object per log for long-running challenges. `fields` only
+    applies to the default format.
+
+    Responses carry an `ETag` and a `Last-Modified`, and a matching conditional
+    request gets a 304 before any log is loaded. Identical concurrent requests
+    share one run of the queries and serialization.
 
     Args:
         challenge_id (int): Unique identifier of the challenge.
+        request (Request): The request, possibly conditional.
+        log_format (schemas.LogListFormat, optional): `objects` (default) or
+            `columnar`.
+        page (pagination.PageRequest): Page to fetch (`limit`, `cursor`, `from`,
+            `to`).
+        fields (Fieldset): Fields to return, only their columns are selected.
         current_user (schemas.TokenData): The authenticated user.
-        db (Session, optional): SQLAlchemy database session dependency.
 
     Returns:
-        List[schemas.DailyLogResponse]: A list of daily log entries for the specified challenge.
+        Response: A page of the challenge's daily log entries as JSON, in the
+            requested format, or a 304.
 
     Raises:
         HTTPException: If the challenge does not exist or does not belong to the user.
     """
-    # Check if the challenge exists and belongs to the current user
-    challenge = (
-        db.query(database.Challenge)
-        .filter(
-            database.Challenge.id == challenge_id,
-            database.Challenge.user_id == current_user.id,
+    async with database.read_session(current_user.id) as db:
+        aggregates, last_modified = await crud.owned_log_list_version(
+            db, challenge_id, current_user.id
+        )
+        validators = conditional.make_validators(request, aggregates, last_modified)
+        # Without logs, ownership is unknown until the listing query checks it
+        if aggregates[0] and conditional.is_not_modified(request, validators):
+            return conditional.not_modified(validators)
+
+        # Retrieve the logs, the query only matches a challenge of the current user
+        logs = await crud.list_owned_logs(
+            db,
+            challenge_id,
+            current_user.id,
+            page,
+            columns=_log_columns(log_format, fields),
         )
-        .first()
-    )
 
-    if not challenge:
+    if logs is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to access logs for this challenge.",
         )
 
-    # Retrieve logs for the challenge if the user is authorized
-    logs = (
-        db.query(database.DailyLog)
-        .filter(database.DailyLog.challenge_id == challenge_id)
-        .all()
+    response = Response(media_type="application/json")
+    logs = pagination.finish_page(logs, page, response, "log_date", request)
+    headers = validators.headers()
+    for name in pagination.NEXT_PAGE_HEADERS:
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    if log_format is schemas.LogListFormat.columnar:
+        return FastJSONResponse(columnar_logs(challenge_id, logs), headers=headers)
+    return RowsResponse(
+        logs, serializer(schemas.DailyLogResponse, fields), headers=headers
     )
-    return logs
 
 
 @router.put("/{log_id}", response_model=schemas.DailyLogResponse)
-def update_daily_log(
+async def update_daily_log(
     log_id: int,
     log_update: schemas.DailyLogUpdate,
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
-) -> database.DailyLog:
+    db: database.DBSession = Depends(database.get_write_db),
+) -> dict:
     """
     Update an existing daily log entry if the user is the owner of the associated challenge.
 
@@ -113,7 +219,7 @@ def update_daily_log(
         log_id (int): Unique identifier of the log entry to update.
         log_update (schemas.DailyLogUpdate): Data to update the log entry.
         current_user (schemas.TokenData): The authenticated user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.DailyLogResponse: Updated daily log entry.
@@ -121,44 +227,30 @@ def update_daily_log(
     Raises:
         HTTPException: If the daily log entry is not found or the user is not authorized.
     """
-    # Retrieve the log entry and ensure it exists
-    log_entry = (
-        db.query(database.DailyLog).filter(database.DailyLog.id == log_id).first()
-    )
-    if not log_entry:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found"
-        )
-
-    # Verify ownership by checking if the challenge belongs to the authenticated user
-    challenge = (
-        db.query(database.Challenge)
-        .filter(
-            database.Challenge.id == log_entry.challenge_id,
-            database.Challenge.user_id == current_user.id,
-        )
-        .first()
+    # Update the log entry only if its challenge belongs to the authenticated user
+    log_entry = await crud.update_owned_log(
+        db, log_id, current_user.id, log_update.completed
     )
 
-    if not challenge:
+    if log_entry is None:
+        # Nothing matched, tell a missing entry apart from someone else's
+        if not await crud.log_exists(db, log_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to update this log entry",
         )
 
-    # Proceed to update the log entry if ownership is confirmed
-    log_entry.completed = log_update.completed
-    db.commit()
-    db.refresh(log_entry)
-
     return log_entry
 
 
 @router.delete("/{log_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_daily_log(
+async def delete_daily_log(
     log_id: int,
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
+    db: database.DBSession = Depends(database.get_write_db),
 ) -> None:
     """
     Delete a daily log entry by its ID if the user is the owner of the associated challenge.
@@ -166,37 +258,21 @@ def delete_daily_log(
     Args:
         log_id (int): Unique identifier of the log entry to delete.
         current_user (schemas.TokenData): The authenticated user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Raises:
         HTTPException: If the daily log entry is not found or the user is not authorized.
     """
-    # Retrieve the log entry and ensure it exists
-    log_entry = (
-        db.query(database.DailyLog).filter(database.DailyLog.id == log_id).first()
-    )
-    if not log_entry:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found"
-        )
-
-    # Verify ownership by checking if the challenge belongs to the authenticated user
-    challenge = (
-        db.query(database.Challenge)
-        .filter(
-            database.Challenge.id == log_entry.challenge_id,
-            database.Challenge.user_id == current_user.id,
-        )
-        .first()
-    )
-
-    if not challenge:
+    # Delete the log entry only if its challenge belongs to the authenticated user
+    if not await crud.delete_owned_log(db, log_id, current_user.id):
+        # Nothing matched, tell a missing entry apart from someone else's
+        if not await crud.log_exists(db, log_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to delete this log entry",
         )
 
-    # Proceed to delete the log entry if ownership is confirmed
-    db.delete(log_entry)
-    db.commit()
     return None
@@ -0,0 +1,139 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app import cache, coalescing, crud, database, utils
+from app.hashing import password_hasher
+from app.ratelimit import login_limiters
+from app.revocation import revocations
+
+# Initialize the router, every internal endpoint requires the internal key
+router = APIRouter(dependencies=[Depends(utils.verify_internal_key)])
+
+
+@router.get("/pool")
+async def get_pool_status() -> dict:
+    """
+    Report the live state of the database connection pool.
+
+    Returns:
+        dict: Per engine, the pool size and overflow limit, connections checked in
+            and out, overflow connections in use and how long checkouts waited. In
+            sync mode, where requests queue for a session slot before the pool,
+            `slot_waits` reports those waits and timeouts.
+    """
+    return database.pool_status()
+
+
+@router.get("/password-hashing")
+async def get_password_hashing_status() -> dict:
+    """
+    Report the load of the password hashing workers.
+
+    Returns:
+        dict: Workers and queue size, hashes running and queued, completed and
+            rejected counts and the hash latency, queueing included.
+    """
+    return password_hasher.stats()
+
+
+@router.get("/password-hash-costs")
+async def get_password_hash_costs(
+    db: database.DBSession = Depends(database.get_db),
+) -> dict:
+    """
+    Report how many users have a password hash of each bcrypt cost, next to the
+    configured cost and the measured hash latency.
+
+    Args:
+        db (DBSession, optional): SQLAlchemy database session dependency.
+
+    Returns:
+        dict: The configured cost, the user count per cost and the latency of the
+            hashes run by this process.
+    """
+    stats = password_hasher.stats()
+    return {
+        "configured_rounds": password_hasher.rounds,
+        "users_by_rounds": await crud.password_hash_costs(db),
+        "hash_latency_avg_ms": stats["latency_avg_ms"],
+        "hash_latency_histogram": stats["latency_histogram"],
+    }
+
+
+@router.get("/login-limits")
+async def get_login_limits() -> dict:
+    """
+    Report the login admission counters.
+
+    Returns:
+        dict: Per limiter (client IP, username), its rate and burst, the attempts
+            allowed and rejected and the number of keys tracked.
+    """
+    return {limiter.name: limiter.stats() for limiter in login_limiters}
+
+
+@router.get("/response-caches")
+async def get_response_caches() -> dict:
+    """
+    Report the caches of serialized responses and the backend storing them.
+
+    Returns:
+        dict: The backend's state, and per cache its TTL, hits, misses and hit
+            ratio.
+    """
+    caches = [cache.challenge_list_cache, cache.profile_cache]
+    return {
+        "backend": cache.backend.stats(),
+        "caches": {
+            response_cache.name: response_cache.stats() for response_cache in caches
+        },
+    }
+
+
+@router.get("/coalesced-reads")
+async def get_coalesced_reads() -> dict:
+    """
+    Report how many identical concurrent reads were merged.
+
+    Returns:
+        dict: Per endpoint, the reads run and joined, the share joined and the
+            reads in flight.
+    """
+    flights = [
+        coalescing.challenge_list_flight,
+        coalescing.log_list_flight,
+        coalescing.shared_inbox_flight,
+    ]
+    return {flight.name: flight.stats() for flight in flights}
+
+
+@router.get("/token-revocations")
+async def get_token_revocations() -> dict:
+    """
+    Report the in-memory deny-list of revoked tokens of this process.
+
+    Returns:
+        dict: Revoked tokens and user cutoffs held, the Bloom filter's size and
+            load, and the last `revoked_tokens` row loaded.
+    """
+    return revocations.stats()
+
+
+@router.post("/users/{user_id}/revoke-sessions", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_user_sessions(
+    user_id: int, db: database.DBSession = Depends(database.get_db)
+) -> None:
+    """
+    Revoke every token issued to a user so far, logging them out everywhere.
+
+    Args:
+        user_id (int): Unique identifier of the user.
+        db (DBSession, optional): SQLAlchemy database session dependency.
+
+    Raises:
+        HTTPException: If the user does not exist.
+    """
+    if await crud.get_user(db, user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    await crud.revoke_user_sessions(db, user_id)
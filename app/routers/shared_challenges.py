@@ -1,10 +1,10 @@
-from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
-from app import database, schemas, utils
+from app import coalescing, conditional, crud, database, schemas, utils
+from app.fieldsets import Fieldset, fields_query, serializer
+from app.serialization import RowsResponse
 
 # Initialize the router
 router = APIRouter()
@@ -15,98 +15,88 @@ router = APIRouter()
     response_model=schemas.SharedChallengeResponse,
     status_code=status.HTTP_201_CREATED,
 )
-def share_challenge(
+async def share_challenge(
     shared_challenge: schemas.SharedChallengeCreate,
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
-) -> database.SharedChallenge:
+    db: database.DBSession = Depends(database.get_write_db),
+) -> dict:
     """
-    Share a challenge with another user.
+    Share a challenge owned by the current user with another user.
 
     Args:
         shared_challenge (schemas.SharedChallengeCreate): Data needed to share a challenge.
-        db (Session, optional): SQLAlchemy database session dependency.
+        current_user (schemas.TokenData): The authenticated user.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.SharedChallengeResponse: Details of the shared challenge.
+
+    Raises:
+        HTTPException: If the challenge is not one of the user's or the recipient
+            does not exist.
     """
-    # Assuming `challenge_id` and `shared_user_id` are obtained from the request
-    challenge = (
-        db.query(database.Challenge)
-        .filter(database.Challenge.id == shared_challenge.challenge_id)
-        .first()
-    )
-    shared_user = (
-        db.query(database.User)
-        .filter(database.User.id == shared_challenge.shared_user_id)
-        .first()
+    new_shared_challenge = await crud.share_owned_challenge(
+        db,
+        shared_challenge.challenge_id,
+        current_user.id,
+        shared_challenge.shared_user_id,
     )
 
-    if not challenge or not shared_user:
+    if new_shared_challenge is None:
         raise HTTPException(status_code=404, detail="Challenge or User not found")
 
-    new_shared_challenge = database.SharedChallenge(
-        challenge=challenge,
-        shared_user=shared_user,
-        shared_at=datetime.now(),
-    )
-    db.add(new_shared_challenge)
-    db.commit()
-    db.refresh(new_shared_challenge)
+    return {**new_shared_challenge, "shared_by": current_user.username}
+
 
-    return new_shared_challenge
+# Parses the `fields` of inbox reads
+shared_fields = fields_query(schemas.SharedChallengeResponse)
 
 
 @router.get("/user", response_model=List[schemas.SharedChallengeResponse])
-def get_shared_challenges(
+@coalescing.coalesced(coalescing.shared_inbox_flight)
+async def get_shared_challenges(
+    request: Request,
+    fields: Fieldset = Depends(shared_fields),
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
-) -> List[database.SharedChallenge]:
+) -> Response:
     """
-    Retrieve all shared challenges for a specific user.
+    Retrieve all challenges shared with the authenticated user.
+
+    Responses carry an `ETag` and a `Last-Modified`, and a matching conditional
+    request gets a 304 before the shares are queried. Identical concurrent requests
+    share one run of the queries and serialization.
 
     Args:
-        user_id (int): Unique identifier of the user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        request (Request): The request, possibly conditional.
+        fields (Fieldset): Fields to return, only their columns are selected.
+        current_user (schemas.TokenData): The authenticated user.
 
     Returns:
-        List[schemas.SharedChallengeResponse]: A list of challenges shared with the specified user.
+        Response: The challenges shared with the user as JSON, or a 304.
     """
+    async with database.read_session(current_user.id) as db:
+        aggregates, last_modified = await crud.shared_with_version(
+            db, current_user.id
+        )
+        validators = conditional.make_validators(request, aggregates, last_modified)
+        if conditional.is_not_modified(request, validators):
+            return conditional.not_modified(validators)
 
-    shared_challenges = (
-        db.query(database.SharedChallenge)
-        .options(joinedload(database.SharedChallenge.challenge))
-        .filter(database.SharedChallenge.shared_user_id == current_user.id)
-        .all()
-    )
+        # One joined query already yields the response fields, owner name included
+        shares = await crud.list_shared_with(db, current_user.id, fields)
 
-    if not shared_challenges:
-        return []
-
-    # Convert database models to the response schema
-    response_data = []
-    for shared_challenge in shared_challenges:
-        challenge = shared_challenge.challenge
-        response_data.append(
-            schemas.SharedChallengeResponse(
-                id=shared_challenge.id,
-                challenge_id=challenge.id,
-                name=challenge.name,
-                description=challenge.description,
-                started_at=challenge.started_at,
-                completed_at=challenge.completed_at,
-                shared_at=shared_challenge.shared_at,
-                shared_by=shared_challenge.challenge.user.username,
-            )
-        )
-    return response_data
+    return RowsResponse(
+        shares,
+        serializer(schemas.SharedChallengeResponse, fields),
+        headers=validators.headers(),
+    )
 
 
 @router.delete("/id_{shared_challenge_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_shared_challenge(
+async def delete_shared_challenge(
     shared_challenge_id: int,
     current_user: schemas.TokenData = Depends(utils.verify_token),
-    db: Session = Depends(database.get_db),
+    db: database.DBSession = Depends(database.get_write_db),
 ) -> None:
     """
     Delete a shared challenge entry by its ID if the user is the owner of the original challenge.
@@ -114,39 +104,22 @@ def delete_shared_challenge(
     Args:
         shared_challenge_id (int): Unique identifier of the shared challenge entry to delete.
         current_user (schemas.TokenData): The authenticated user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Raises:
         HTTPException: If the shared challenge entry is not found or the user is not authorized.
     """
-    # Retrieve the shared challenge entry and ensure it exists
-    shared_challenge = (
-        db.query(database.SharedChallenge)
-        .filter(database.SharedChallenge.id == shared_challenge_id)
-        .first()
-    )
-    if not shared_challenge:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Shared challenge not found"
-        )
-
-    # Verify ownership by checking if the original challenge belongs to the authenticated user
-    challenge = (
-        db.query(database.Challenge)
-        .filter(
-            database.Challenge.id == shared_challenge.challenge_id,
-            database.Challenge.user_id == current_user.id,
-        )
-        .first()
-    )
-
-    if not challenge:
+    # Delete the entry only if the original challenge belongs to the authenticated user
+    if not await crud.delete_owned_share(db, shared_challenge_id, current_user.id):
+        # Nothing matched, tell a missing entry apart from someone else's
+        if not await crud.share_exists(db, shared_challenge_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Shared challenge not found",
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to delete this shared challenge",
         )
 
-    # Proceed to delete the shared challenge entry if ownership is confirmed
-    db.delete(shared_challenge)
-    db.commit()
     return None
@@ -1,12 +1,17 @@
+import math
 from datetime import timedelta
+from typing import AsyncIterator
 
-import bcrypt
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 
-from app import database, schemas
+from app import crud, database, schemas
+from app.cache import profile_cache, user_tag
 from app.config import settings
+from app.hashing import HasherBusy, password_hasher
+from app.ratelimit import admit_login, client_ip
 from app.schemas import TokenData
+from app.serialization import RowSerializer
 from app.utils import create_access_token, oauth2_scheme, verify_token
 
 router = APIRouter()
@@ -15,69 +20,93 @@ router = APIRouter()
 @router.post(
     "/", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED
 )
-def create_user(
-    user: schemas.UserCreate, db: Session = Depends(database.get_db)
+async def create_user(
+    user: schemas.UserCreate, db: database.DBSession = Depends(database.get_db)
 ) -> database.User:
     """
     Create a new user in the system.
 
     Args:
         user (schemas.UserCreate): User data to create a new user.
-        db (Session, optional): SQLAlchemy database session dependency.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.UserResponse: Created user details.
     """
-    # Check if user with the same username or email already exists
-    existing_user = (
-        db.query(database.User)
-        .filter(
-            (database.User.username == user.username)
-            | (database.User.email == user.email)
-        )
-        .first()
+    user_taken = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="A user with this username or email already exists.",
     )
 
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="A user with this username or email already exists.",
-        )
+    # Check if user with the same username or email already exists
+    if await crud.user_exists(db, user.username, user.email):
+        raise user_taken
 
-    # Hash the password
-    hashed_password = bcrypt.hashpw(user.password.encode("utf-8"), bcrypt.gensalt())
+    # bcrypt is CPU bound, it runs on the dedicated hashing processes
     db_user = database.User(
         username=user.username,
         email=user.email,
-        password_hash=hashed_password.decode("utf-8"),
+        password_hash=await password_hasher.hash(user.password),
     )
 
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    if not await crud.create_user(db, db_user):
+        raise user_taken  # Registered concurrently since the check above
 
     return db_user
 
 
+async def admitted_login(
+    user: schemas.UserLogin, request: Request
+) -> schemas.UserLogin:
+    """
+    Admit a login attempt against the per-IP and per-username rate limits.
+
+    Declared before the session dependency of `login`, so refused attempts cost
+    neither a database session nor a bcrypt hash.
+
+    Args:
+        user (schemas.UserLogin): User credentials for authentication.
+        request (Request): The incoming request, identifying the client IP, from
+            `X-Forwarded-For` behind TRUSTED_PROXIES.
+
+    Returns:
+        schemas.UserLogin: The credentials, if the attempt is admitted.
+
+    Raises:
+        HTTPException: 429 if the client IP or the username made too many attempts.
+    """
+    retry_after = admit_login(client_ip(request), user.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    return user
+
+
 @router.post("/token", response_model=schemas.Token)
-def login(
-    user: schemas.UserLogin, db: Session = Depends(database.get_db)
+async def login(
+    user: schemas.UserLogin = Depends(admitted_login),
+    db: database.DBSession = Depends(database.get_db),
 ) -> dict[str, str]:
     """
-    Authenticate a user and return a JWT token.
+    Authenticate a user and return a JWT token. A password hashed with another
+    cost than BCRYPT_ROUNDS is rehashed and stored again.
 
     Args:
-        user (schemas.UserCreate): User credentials for authentication.
-        db (Session, optional): SQLAlchemy database session dependency.
+        user (schemas.UserLogin): Admitted user credentials for authentication.
+        db (DBSession, optional): SQLAlchemy database session dependency.
 
     Returns:
         schemas.Token: JWT access token for the authenticated user.
+
+    Raises:
+        HTTPException: If the credentials are wrong.
     """
-    db_user = (
-        db.query(database.User).filter(database.User.username == user.username).first()
-    )
-    if db_user is None or not bcrypt.checkpw(
-        user.password.encode("utf-8"), db_user.password_hash.encode("utf-8")
+    db_user = await crud.get_user_by_username(db, user.username)
+    if db_user is None or not await password_hasher.verify(
+        user.password, db_user.password_hash
     ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -85,6 +114,15 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Move the stored hash to the configured cost while the password is at hand
+    if password_hasher.needs_rehash(db_user.password_hash):
+        try:
+            new_hash = await password_hasher.hash(user.password)
+        except HasherBusy:
+            pass  # The login succeeded, the next one rehashes
+        else:
+            await crud.update_password_hash(db, db_user.id, new_hash)
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": db_user.username, "id": db_user.id},
@@ -94,9 +132,11 @@ def login(
 
 
 @router.get("/refresh_token", response_model=schemas.Token)
-def refresh_token(token: str = Depends(oauth2_scheme)) -> dict[str, str]:
+async def refresh_token(token: str = Depends(oauth2_scheme)) -> dict[str, str]:
     """
-    Refresh the JWT token if it is about to expire.
+    Refresh the JWT token if it is about to expire. A revoked token cannot be
+    refreshed, and revoking all of a user's sessions also revokes the tokens
+    refreshed before.
 
     Args:
         token (str): The current JWT token to refresh.
@@ -104,7 +144,7 @@ def refresh_token(token: str = Depends(oauth2_scheme)) -> dict[str, str]:
     Returns:
         schemas.Token: New JWT token with extended expiration.
     """
-    payload = verify_token(token)
+    payload = await verify_token(token)
     new_access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     new_access_token = create_access_token(
         data={"sub": payload.username, "id": payload.id},
@@ -113,35 +153,160 @@ def refresh_token(token: str = Depends(oauth2_scheme)) -> dict[str, str]:
     return {"access_token": new_access_token, "token_type": "bearer"}
 
 
-@router.get("/profile", response_model=schemas.UserResponse)
-def get_current_user(
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
     current_user: TokenData = Depends(verify_token),
-    db: Session = Depends(database.get_db),
-) -> database.User:
+    db: database.DBSession = Depends(database.get_write_db),
+) -> None:
     """
-    Retrieve the profile of the current authenticated user.
+    Revoke the token the request was made with.
 
-    This endpoint uses the JWT token to identify the user and return their profile data.
+    Args:
+        current_user (TokenData): Token data extracted from the validated JWT token.
+        db (DBSession): SQLAlchemy database session.
+    """
+    await crud.revoke_token(db, current_user)
+
+
+@router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
+async def change_password(
+    passwords: schemas.PasswordChange,
+    current_user: TokenData = Depends(verify_token),
+    db: database.DBSession = Depends(database.get_write_db),
+) -> None:
+    """
+    Change the password of the authenticated user and revoke all of the user's
+    tokens, the one used for this request included.
+
+    Args:
+        passwords (schemas.PasswordChange): The current and the new password.
+        current_user (TokenData): Token data extracted from the validated JWT token.
+        db (DBSession): SQLAlchemy database session.
+
+    Raises:
+        HTTPException: If the current password is wrong.
+    """
+    db_user = await crud.get_user(db, current_user.id)
+    if db_user is None or not await password_hasher.verify(
+        passwords.current_password, db_user.password_hash
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Incorrect current password",
+        )
+
+    await crud.change_password(
+        db, db_user.id, await password_hasher.hash(passwords.new_password)
+    )
+
+
+async def current_profile(
+    current_user: TokenData = Depends(verify_token),
+) -> schemas.UserResponse:
+    """
+    Look up the profile of the authenticated user, from the profile cache when
+    possible. The session is only opened on a cache miss.
 
     Args:
         current_user (TokenData): Token data extracted from the validated JWT token.
-        db (Session): SQLAlchemy database session.
 
     Returns:
-        database.User: The authenticated user object.
+        schemas.UserResponse: The user's profile.
 
     Raises:
-        HTTPException: If the token is invalid or the user does not exist.
+        HTTPException: If the user does not exist.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    key = str(current_user.id)
+    tags = [user_tag(current_user.id), user_tag(current_user.id, "profile")]
+    lookup = await profile_cache.get(key, tags)
+    if lookup.value is not None:
+        return schemas.UserResponse.model_validate_json(lookup.value)
 
-    # Query the database to find the user by ID obtained from the token
-    user = db.query(database.User).filter(database.User.id == current_user.id).first()
+    async with database.read_session(current_user.id) as db:
+        user = await crud.get_user(db, current_user.id)
     if user is None:
-        raise credentials_exception  # Raise an error if user does not exist
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    profile = schemas.UserResponse.model_validate(user, from_attributes=True)
+    await profile_cache.put(
+        key, tags, profile.model_dump_json().encode("utf-8"), lookup.versions
+    )
+    return profile
 
-    return user  # Return the user profile
+
+@router.get("/profile", response_model=schemas.UserResponse)
+async def get_current_user(
+    profile: schemas.UserResponse = Depends(current_profile),
+) -> schemas.UserResponse:
+    """
+    Retrieve the profile of the current authenticated user.
+
+    This endpoint uses the JWT token to identify the user and return their profile
+    data, cached for at most PROFILE_CACHE_TTL seconds.
+
+    Args:
+        profile (schemas.UserResponse): The authenticated user's profile.
+
+    Returns:
+        schemas.UserResponse: The authenticated user's profile.
+    """
+    return profile
+
+
+# Encoders of the records of a data export, by record type
+export_serializers = {
+    "challenge": RowSerializer(schemas.ChallengeResponse),
+    "daily_log": RowSerializer(schemas.DailyLogResponse),
+    "shared_challenge": RowSerializer(schemas.SharedChallengeExport),
+}
+
+
+async def export_lines(user_id: int) -> AsyncIterator[bytes]:
+    """
+    Stream a user's data as NDJSON, one `{"type": ..., "data": ...}` record per
+    line, a chunk of EXPORT_CHUNK_SIZE rows at a time.
+
+    Args:
+        user_id (int): The exported user.
+
+    Yields:
+        bytes: The lines of the next chunk of rows.
+    """
+    # Opened here rather than as a dependency, the session must outlive the handler
+    async with database.read_session(user_id) as db:
+        for record_type, query in crud.export_queries(user_id).items():
+            serializer = export_serializers[record_type]
+            prefix = b'{"type":"%s","data":' % record_type.encode("ascii")
+            async for rows in crud.stream_rows(db, query, settings.EXPORT_CHUNK_SIZE):
+                yield b"".join(
+                    prefix + data + b"}\n" for data in serializer.dump_objects(rows)
+                )
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_user_data(
+    current_user: TokenData = Depends(verify_token),
+) -> StreamingResponse:
+    """
+    Export all of the authenticated user's data as NDJSON: their challenges, the
+    daily logs of those challenges and the shares they made or received.
+
+    The rows are read through server-side cursors and written out as they come,
+    so memory use does not grow with the size of the history.
+
+    Args:
+        current_user (TokenData): The authenticated user.
+
+    Returns:
+        StreamingResponse: The records, one JSON object per line.
+    """
+    return StreamingResponse(
+        export_lines(current_user.id),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="daily-task-tracker.ndjson"'
+        },
+    )
@@ -1,7 +1,10 @@
 from datetime import date, datetime
-from typing import Optional
+from enum import Enum
+from typing import List, NamedTuple, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+
+from app.config import settings
 
 
 # User Schemas
@@ -37,8 +40,7 @@ class UserResponse(BaseModel):
     created_at: datetime
     is_active: bool
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserLogin(BaseModel):
@@ -54,6 +56,19 @@ class UserLogin(BaseModel):
     password: str = Field(..., min_length=8)
 
 
+class PasswordChange(BaseModel):
+    """
+    Schema to change the password of the authenticated user.
+
+    Attributes:
+        current_password (str): The user's current password.
+        new_password (str): The new plain text password (will be hashed).
+    """
+
+    current_password: str = Field(..., min_length=8)
+    new_password: str = Field(..., min_length=8)
+
+
 # Challenge Schemas
 class ChallengeCreate(BaseModel):
     """
@@ -86,8 +101,7 @@ class ChallengeResponse(BaseModel):
     started_at: datetime
     completed_at: Optional[datetime]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # DailyLog Schemas
@@ -106,6 +120,19 @@ class DailyLogCreate(BaseModel):
     challenge_id: int
 
 
+class OnConflict(str, Enum):
+    """
+    How to handle a daily log for a challenge and date that already has one.
+
+    Attributes:
+        reject: Keep the existing log and report the duplicate.
+        overwrite: Replace the existing log's `completed` flag.
+    """
+
+    reject = "reject"
+    overwrite = "overwrite"
+
+
 class DailyLogUpdate(BaseModel):
     """
     Schema for updating a daily log entry.
@@ -132,8 +159,100 @@ class DailyLogResponse(BaseModel):
     log_date: date
     completed: bool
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LogListFormat(str, Enum):
+    """
+    Representation of a list of daily logs.
+
+    Attributes:
+        objects: One `DailyLogResponse` object per log.
+        columnar: One `DailyLogColumnarResponse` for the whole list.
+    """
+
+    objects = "objects"
+    columnar = "columnar"
+
+
+class DailyLogColumnarResponse(BaseModel):
+    """
+    Schema for representing a list of daily log entries as run-length encoded
+    columns rather than one object per log.
+
+    Attributes:
+        challenge_id (int): ID of the challenge the logs belong to.
+        start_date (Optional[date]): Day of the first log, None if there are none.
+        logged_runs (List[int]): Lengths of the alternating runs of logged and
+            unlogged days from `start_date`, starting with logged days.
+        completed_runs (List[int]): Lengths of the alternating runs of completed
+            and not completed logs in date order, starting with completed ones (so
+            the first run is 0 if the first log is not completed).
+        ids (List[int]): IDs of the logs, in date order.
+    """
+
+    challenge_id: int
+    start_date: Optional[date]
+    logged_runs: List[int]
+    completed_runs: List[int]
+    ids: List[int]
+
+
+class DailyLogBulkCreate(BaseModel):
+    """
+    Schema for creating many daily log entries in one request.
+
+    Attributes:
+        items (List[DailyLogCreate]): Log entries to create, at most
+            `settings.BULK_LOG_MAX_ITEMS`.
+    """
+
+    items: List[DailyLogCreate] = Field(
+        ..., min_length=1, max_length=settings.BULK_LOG_MAX_ITEMS
+    )
+
+
+class BulkLogStatus(str, Enum):
+    """
+    Outcome of one item of a bulk daily log request.
+
+    Attributes:
+        created: A new log entry was stored.
+        overwritten: An existing log entry was replaced.
+        duplicate: The day was already logged, or repeated within the request.
+        forbidden: The challenge does not exist or belongs to another user.
+    """
+
+    created = "created"
+    overwritten = "overwritten"
+    duplicate = "duplicate"
+    forbidden = "forbidden"
+
+
+class DailyLogBulkResult(BaseModel):
+    """
+    Schema for the result of one item of a bulk daily log request.
+
+    Attributes:
+        index (int): Position of the item in the request.
+        status (BulkLogStatus): What happened to the item.
+        id (Optional[int]): ID of the stored log entry for the item's day, if any.
+    """
+
+    index: int
+    status: BulkLogStatus
+    id: Optional[int]
+
+
+class DailyLogBulkResponse(BaseModel):
+    """
+    Schema for representing the outcome of a bulk daily log request.
+
+    Attributes:
+        results (List[DailyLogBulkResult]): One result per requested item, in order.
+    """
+
+    results: List[DailyLogBulkResult]
 
 
 # SharedChallenge Schemas
@@ -170,8 +289,24 @@ class SharedChallengeResponse(BaseModel):
     shared_at: datetime
     shared_by: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SharedChallengeExport(BaseModel):
+    """
+    Schema for representing a share in a user's data export.
+
+    Attributes:
+        id (int): Unique identifier for the shared challenge record.
+        challenge_id (int): ID of the challenge being shared.
+        shared_user_id (int): ID of the user with whom the challenge is shared.
+        shared_at (datetime): Date and time when the challenge was shared.
+    """
+
+    id: int
+    challenge_id: int
+    shared_user_id: int
+    shared_at: datetime
 
 
 class Token(BaseModel):
@@ -187,13 +322,23 @@ class Token(BaseModel):
     token_type: str
 
 
-class TokenData(BaseModel):
+class TokenData(NamedTuple):
     """
-    Schema for representing the payload data contained in a JWT token.
+    The authenticated principal carried by a JWT token. A plain immutable tuple
+    rather than a model, as it is built or looked up on every authenticated
+    request and shared between requests by the token cache.
 
     Attributes:
         id (int): The unique identifier of the user to whom the token belongs.
+        username (str): The username of that user.
+        jti (str, optional): Unique identifier of the token, used to revoke it.
+        issued_at (float): When the token was issued, as a UNIX timestamp. 0 for
+            tokens issued without an `iat` claim.
+        expires_at (float, optional): When the token expires, as a UNIX timestamp.
     """
 
     id: int
     username: str
+    jti: Optional[str] = None
+    issued_at: float = 0.0
+    expires_at: Optional[float] = None
@@ -0,0 +1,187 @@
+"""
+Fast-path JSON encoding of responses built from the server's own rows.
+
+Response models validate what they are given, which for a list route means
+rebuilding a model per row from the ORM object before dumping it again. Rows
+read from our own database already have the declared types, so a `RowSerializer`
+only picks the model's fields off each row and hands them to a serializer
+compiled once from the model, which encodes them straight to JSON bytes in Rust.
+"""
+
+from datetime import date, datetime
+from operator import attrgetter, itemgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Type,
+)
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+from typing_extensions import TypedDict
+
+
+def _day(value: date) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _tuple_getter(getter: Callable, fields: int) -> Callable:
+    # attrgetter and itemgetter return a bare value rather than a tuple for one name
+    if fields == 1:
+        return lambda row: (getter(row),)
+    return getter
+
+
+class RowSerializer:
+    """
+    Encoder of rows to the JSON a response model would produce, without
+    validating them, optionally trimmed to a subset of the model's fields.
+
+    Attributes:
+        model (Type[BaseModel]): The response model the output matches.
+        fields (tuple): Names of the fields encoded, in declaration order.
+    """
+
+    def __init__(
+        self, model: Type[BaseModel], fields: Optional[Sequence[str]] = None
+    ) -> None:
+        self.model = model
+        self.fields = tuple(
+            name for name in model.model_fields if fields is None or name in fields
+        )
+        annotations = {
+            name: model.model_fields[name].annotation for name in self.fields
+        }
+        # The same fields and types as the model, but serialized as plain dicts
+        row_type = TypedDict(f"{model.__name__}Row", annotations)
+        self._rows = TypeAdapter(List[row_type])
+        self._row = TypeAdapter(row_type)
+        self._attributes = _tuple_getter(attrgetter(*self.fields), len(self.fields))
+        self._items = _tuple_getter(itemgetter(*self.fields), len(self.fields))
+        # Days are stored as midnight timestamps, which validation would truncate
+        self._dates = tuple(
+            name
+            for name, annotation in annotations.items()
+            if annotation in (date, Optional[date])
+        )
+
+    def to_dicts(self, rows: Iterable[Any]) -> List[Dict[str, Any]]:
+        """
+        Pick the model's fields off each row.
+
+        Args:
+            rows (Iterable[Any]): ORM objects, or mappings such as projected rows.
+
+        Returns:
+            List[Dict[str, Any]]: One dict of the model's fields per row.
+        """
+        fields, items, attributes = self.fields, self._items, self._attributes
+        dicts = [
+            dict(zip(fields, (items if isinstance(row, Mapping) else attributes)(row)))
+            for row in rows
+        ]
+        for name in self._dates:
+            for values in dicts:
+                values[name] = _day(values[name])
+        return dicts
+
+    def dump_json(self, rows: Iterable[Any]) -> bytes:
+        """
+        Encode rows as a JSON array of the model.
+
+        Args:
+            rows (Iterable[Any]): ORM objects, or mappings such as projected rows.
+
+        Returns:
+            bytes: The JSON array.
+        """
+        return self._rows.dump_json(self.to_dicts(rows))
+
+    def dump_objects(self, rows: Iterable[Any]) -> List[bytes]:
+        """
+        Encode rows as separate JSON objects of the model, e.g. for NDJSON.
+
+        Args:
+            rows (Iterable[Any]): ORM objects, or mappings such as projected rows.
+
+        Returns:
+            List[bytes]: One JSON object per row.
+        """
+        return [self._row.dump_json(values) for values in self.to_dicts(rows)]
+
+
+def columnar_logs(challenge_id: int, logs: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Run-length encode the daily logs of a challenge, in the shape of
+    `DailyLogColumnarResponse`.
+
+    Args:
+        challenge_id (int): The challenge the logs belong to.
+        logs (Sequence[Any]): Its logs in date order, at most one per day.
+
+    Returns:
+        Dict[str, Any]: The first day, the runs of logged days and of completed
+            logs, and the logs' ids.
+    """
+    days = [_day(log.log_date) for log in logs]
+    logged_runs: List[int] = [1] if days else []
+    for previous, day in zip(days, days[1:]):
+        gap = (day - previous).days - 1
+        if gap:
+            logged_runs += [gap, 1]
+        else:
+            logged_runs[-1] += 1
+
+    completed_runs: List[int] = [0] if logs else []
+    completed = True
+    for log in logs:
+        if log.completed != completed:
+            completed = log.completed
+            completed_runs.append(0)
+        completed_runs[-1] += 1
+
+    return {
+        "challenge_id": challenge_id,
+        "start_date": days[0] if days else None,
+        "logged_runs": logged_runs,
+        "completed_runs": completed_runs,
+        "ids": [log.id for log in logs],
+    }
+
+
+class RowsResponse(Response):
+    """
+    JSON response of rows encoded by a `RowSerializer`. Returned by an endpoint,
+    it bypasses the route's response model, which then only documents it.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        rows: Iterable[Any],
+        serializer: RowSerializer,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        super().__init__(
+            serializer.dump_json(rows), status_code=status_code, headers=headers
+        )
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class of the app: encodes the validated content with
+    pydantic's Rust encoder instead of the stdlib `json` module.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
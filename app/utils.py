@@ -1,18 +1,56 @@
-from datetime import datetime, timedelta
+import hmac
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional, Tuple
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from app.config import settings
+from app.revocation import revocations
 from app.schemas import TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+def token_timestamp() -> float:
+    """
+    Current time on the clock of the tokens' `iat` and `exp` claims, shared by
+    every timestamp compared with them.
+
+    Returns:
+        float: The current UNIX timestamp, UTC whatever the server's timezone.
+    """
+    return time.time()
+
+
+def token_expiry(issued_at: float, expires_delta: Optional[timedelta] = None) -> float:
+    """
+    Compute the `exp` claim of a token.
+
+    Args:
+        issued_at (float): The token's `iat`, as a UNIX timestamp.
+        expires_delta (timedelta, optional): Lifetime of the token, 15 minutes by
+            default.
+
+    Returns:
+        float: The token's expiry, as a UNIX timestamp.
+    """
+    return issued_at + (expires_delta or timedelta(minutes=15)).total_seconds()
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """
-    Generate a JWT access token.
+    Generate a JWT access token. Each token gets a unique `jti`, through which it
+    can be revoked, and an `iat`, through which all of a user's tokens issued
+    before a point in time can be revoked.
+
+    Tokens carry no profile claims: a profile embedded here would stay stale for
+    the token's whole lifetime, so profiles are served from `cache.profile_cache`
+    instead, which user writes invalidate.
 
     Args:
         data (dict): Data to include in the token payload.
@@ -22,21 +60,96 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         str: The encoded JWT token.
     """
     to_encode = data.copy()
-    expire = (
-        datetime.now() + expires_delta
-        if expires_delta
-        else datetime.now() + timedelta(minutes=15)
+    issued_at = token_timestamp()
+    to_encode.update(
+        {
+            "exp": token_expiry(issued_at, expires_delta),
+            "iat": issued_at,
+            "jti": uuid.uuid4().hex,
+        }
     )
-    to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
     return encoded_jwt
 
 
-def verify_token(token: str = Depends(oauth2_scheme)) -> TokenData:
+class TokenCache:
+    """
+    Size-bounded LRU cache of verified tokens, sparing repeat requests the JWT
+    decode and signature check.
+
+    An entry expires after `ttl` seconds, or at the token's `exp` if that comes
+    first, so an expired token is never accepted from the cache. Only used from
+    the event loop, so no locking is needed.
+
+    Attributes:
+        max_size (int): Most tokens kept, 0 disables the cache.
+        ttl (float): Longest time in seconds a token stays cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[TokenData, float]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[TokenData]:
+        """
+        Look up a verified token.
+
+        Args:
+            token (str): The raw JWT.
+
+        Returns:
+            Optional[TokenData]: The token's principal, or None if the token is not
+                cached or its entry has expired.
+        """
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def put(
+        self, token: str, principal: TokenData, exp: Optional[float] = None
+    ) -> None:
+        """
+        Remember a token that passed verification.
+
+        Args:
+            token (str): The raw JWT.
+            principal (TokenData): The token's principal.
+            exp (float, optional): The token's `exp` claim, as a UNIX timestamp.
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        self._entries[token] = (principal, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget every cached token.
+        """
+        self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+async def verify_token(token: str = Depends(oauth2_scheme)) -> TokenData:
     """
-    Verifies the JWT token passed in the Authorization header.
+    Verifies the JWT token passed in the Authorization header, answering from
+    `token_cache` when the same token was verified recently. Cached or not, the
+    token is checked against the in-memory deny-list of revoked tokens.
 
     Args:
         token (str): The JWT token extracted from the request header.
@@ -45,8 +158,23 @@ def verify_token(token: str = Depends(oauth2_scheme)) -> TokenData:
         TokenData: The data contained within the token (e.g., user ID).
 
     Raises:
-        HTTPException: If the token is invalid or expired.
+        HTTPException: If the token is invalid, expired or revoked.
     """
+    principal = token_cache.get(token)
+    if principal is None:
+        principal = _decode_token(token)
+        token_cache.put(token, principal, principal.expires_at)
+
+    if revocations.is_revoked(principal):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+def _decode_token(token: str) -> TokenData:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -61,7 +189,13 @@ def verify_token(token: str = Depends(oauth2_scheme)) -> TokenData:
         username: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
-        return TokenData(id=user_id, username=username)
+        return TokenData(
+            id=user_id,
+            username=username,
+            jti=payload.get("jti"),
+            issued_at=payload.get("iat", 0.0),
+            expires_at=payload.get("exp"),
+        )
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,3 +204,23 @@ def verify_token(token: str = Depends(oauth2_scheme)) -> TokenData:
         )
     except jwt.InvalidTokenError:
         raise credentials_exception
+
+
+def verify_internal_key(x_internal_key: str = Header(...)) -> None:
+    """
+    Guards the internal endpoints with the shared `INTERNAL_API_KEY`. Every
+    request is refused while no key is configured.
+
+    Args:
+        x_internal_key (str): Value of the `X-Internal-Key` request header.
+
+    Raises:
+        HTTPException: If no key is configured or the header does not match it.
+    """
+    # Compared as bytes: compare_digest rejects str holding non-ASCII characters
+    if not settings.INTERNAL_API_KEY or not hmac.compare_digest(
+        x_internal_key.encode(), settings.INTERNAL_API_KEY.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal key"
+        )
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the Daily Task Tracker API.
+
+Each module is runnable with `python -m benchmarks.<name>` and drives the app
+in-process over ASGI against a throwaway SQLite database. Their extra
+dependencies are listed in `requirements-dev.txt`.
+"""
@@ -0,0 +1,60 @@
+"""
+Microbenchmark of the `verify_token` dependency with and without the verified
+token cache.
+
+Calls `verify_token` `--calls` times with one token, first against a disabled
+cache (every call decodes and checks the JWT), then against the real cache, and
+again once `--revoked` other tokens are on the revocation deny-list.
+
+Usage:
+    python -m benchmarks.auth_cache [--calls 100000] [--revoked 100000]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+
+
+async def time_calls(token: str, calls: int) -> float:
+    from app import utils
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        await utils.verify_token(token)
+    return (time.perf_counter() - started) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--revoked", type=int, default=100000)
+    args = parser.parse_args()
+
+    from app import utils
+    from app.config import settings
+    from app.revocation import revocations
+
+    token = utils.create_access_token(
+        {"sub": "bench", "id": 1},
+        timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+
+    cache = utils.token_cache
+    utils.token_cache = utils.TokenCache(max_size=0, ttl=0)
+    uncached = asyncio.run(time_calls(token, args.calls))
+    utils.token_cache = cache
+    cached = asyncio.run(time_calls(token, args.calls))
+    expires_at = time.time() + 3600
+    for _ in range(args.revoked):
+        revocations.revoke_token(uuid.uuid4().hex, expires_at)
+    denied = asyncio.run(time_calls(token, args.calls))
+
+    print(f"without cache {uncached * 1e6:8.2f} us/call")
+    print(f"with cache    {cached * 1e6:8.2f} us/call  ({uncached / cached:.1f}x)")
+    print(f"{args.revoked} revoked {denied * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measure daily-log ingestion throughput of `POST /api/v1/daily-logs/bulk`.
+
+First stores `--baseline-logs` logs one `POST /api/v1/daily-logs/` at a time, as
+clients did before the bulk endpoint, then imports `--years` of history for
+`--challenges` challenges in batches of `--batch` items. Fails (exit status 1)
+if the import is less than `--min-speedup` times faster than the one-by-one
+baseline on the same machine, or stores fewer than `--target` logs per second.
+The default target leaves a 30% margin under the 5000 logs/s measured on one
+core, absolute throughput varying from run to run.
+
+Usage:
+    python -m benchmarks.bulk_ingest [--min-speedup 20] [--target 3500]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+from typing import Tuple
+
+
+async def one_by_one(client, headers: dict, logs: int) -> float:
+    response = await client.post(
+        "/api/v1/challenges/", json={"name": "one by one"}, headers=headers
+    )
+    challenge_id = response.json()["id"]
+    first_day = date(2024, 1, 1)
+    started = time.perf_counter()
+    for day in range(logs):
+        response = await client.post(
+            "/api/v1/daily-logs/",
+            json={
+                "challenge_id": challenge_id,
+                "log_date": (first_day + timedelta(days=day)).isoformat(),
+                "completed": day % 3 != 0,
+            },
+            headers=headers,
+        )
+        response.raise_for_status()
+    return logs / (time.perf_counter() - started)
+
+
+async def run(
+    challenges: int, years: int, batch: int, baseline_logs: int
+) -> Tuple[float, float]:
+    from benchmarks import common
+
+    common.create_schema()
+    async with common.client() as client:
+        headers = await common.register_and_login(client, "bulk")
+        baseline = await one_by_one(client, headers, baseline_logs)
+        challenge_ids = []
+        for index in range(challenges):
+            response = await client.post(
+                "/api/v1/challenges/",
+                json={"name": f"imported {index}"},
+                headers=headers,
+            )
+            challenge_ids.append(response.json()["id"])
+
+        first_day = date(2024, 1, 1) - timedelta(days=365 * years)
+        items = [
+            {
+                "challenge_id": challenge_id,
+                "log_date": (first_day + timedelta(days=day)).isoformat(),
+                "completed": day % 3 != 0,
+            }
+            for challenge_id in challenge_ids
+            for day in range(365 * years)
+        ]
+
+        started = time.perf_counter()
+        for start in range(0, len(items), batch):
+            response = await client.post(
+                "/api/v1/daily-logs/bulk",
+                json={"items": items[start : start + batch]},
+                headers=headers,
+            )
+            response.raise_for_status()
+        return baseline, len(items) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", type=float, default=3500, help="logs per second")
+    parser.add_argument(
+        "--min-speedup",
+        type=float,
+        default=20,
+        help="least throughput ratio of the import over the one-by-one baseline",
+    )
+    parser.add_argument("--baseline-logs", type=int, default=300)
+    parser.add_argument("--challenges", type=int, default=10)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=2000)
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    baseline, throughput = asyncio.run(
+        run(args.challenges, args.years, args.batch, args.baseline_logs)
+    )
+    speedup = throughput / baseline
+    print(f"one by one:  {baseline:8.0f} logs/s")
+    print(
+        f"bulk ingest: {throughput:8.0f} logs/s (target {args.target:.0f})  "
+        f"x{speedup:.1f} (min x{args.min_speedup:.0f})"
+    )
+    if throughput < args.target or speedup < args.min_speedup:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
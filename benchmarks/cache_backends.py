@@ -0,0 +1,247 @@
+"""
+Check the cache backends against the same scenarios, and time their lookups.
+
+The Redis backend runs against a stand-in server speaking the subset of the
+Redis protocol it uses, started in-process, unless `--url` points at a real
+server. Exits with status 1 if a check fails.
+
+Usage:
+    python -m benchmarks.cache_backends [--url redis://localhost:6379/0] [--runs 2000]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StandInServer:
+    """
+    In-memory server answering PING, AUTH, SELECT, GET, MGET, SET (with PX), INCR,
+    PEXPIRE, EXPIRE and DEL over the Redis protocol, with a single keyspace.
+    """
+
+    def __init__(self) -> None:
+        # key -> (value, expiry as a monotonic time or None)
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/1"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _expire(self, key: bytes, milliseconds: int) -> int:
+        value = self._get(key)
+        if value is None:
+            return 0
+        self.data[key] = (value, time.monotonic() + milliseconds / 1000)
+        return 1
+
+    def _run(self, command: List[bytes]) -> object:
+        name, arguments = command[0].upper(), command[1:]
+        if name == b"PING":
+            return "PONG"
+        if name in (b"AUTH", b"SELECT"):
+            return "OK"
+        if name == b"GET":
+            return self._get(arguments[0])
+        if name == b"MGET":
+            return [self._get(key) for key in arguments]
+        if name == b"SET":
+            expires_at = None
+            if len(arguments) == 4 and arguments[2].upper() == b"PX":
+                expires_at = time.monotonic() + int(arguments[3]) / 1000
+            self.data[arguments[0]] = (arguments[1], expires_at)
+            return "OK"
+        if name == b"INCR":
+            value = self._get(arguments[0])
+            try:
+                number = int(value or 0) + 1
+            except ValueError:
+                return ValueError("ERR value is not an integer or out of range")
+            expires_at = self.data.get(arguments[0], (None, None))[1]
+            self.data[arguments[0]] = (str(number).encode(), expires_at)
+            return number
+        if name == b"PEXPIRE":
+            return self._expire(arguments[0], int(arguments[1]))
+        if name == b"EXPIRE":
+            return self._expire(arguments[0], int(arguments[1]) * 1000)
+        if name == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in arguments)
+        return ValueError(f"ERR unknown command '{name.decode()}'")
+
+    @classmethod
+    def _encode(cls, reply: object) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, ValueError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(map(cls._encode, reply))
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                command = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self._encode(self._run(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def check(backend) -> List[str]:
+    """
+    Run the scenarios against a backend.
+
+    Args:
+        backend (CacheBackend): The backend, empty.
+
+    Returns:
+        List[str]: Descriptions of the failed checks.
+    """
+    failures = []
+
+    def expect(condition: bool, description: str) -> None:
+        if not condition:
+            failures.append(description)
+
+    tags = ["user:1", "user:1:challenges"]
+    value, versions = await backend.get("bench:a", tags)
+    expect(value is None, "an unknown key misses")
+    await backend.set("bench:a", b"\x00page\n\xff", 60, tags, versions)
+    value, _ = await backend.get("bench:a", tags)
+    expect(value == b"\x00page\n\xff", "a stored value is returned byte for byte")
+
+    _, versions = await backend.get("bench:b", ["user:2"])
+    await backend.set("bench:b", b"other", 60, ["user:2"], versions)
+    await backend.invalidate(["user:1:challenges"])
+    value, versions = await backend.get("bench:a", tags)
+    expect(value is None, "invalidating a tag drops its entries")
+    value, _ = await backend.get("bench:b", ["user:2"])
+    expect(value == b"other", "invalidating a tag keeps other users' entries")
+
+    await backend.set("bench:a", b"fresh", 60, tags, versions)
+    value, _ = await backend.get("bench:a", tags)
+    expect(value == b"fresh", "an entry can be stored again after invalidation")
+
+    _, versions = await backend.get("bench:c", tags)
+    await backend.invalidate(["user:1"])
+    await backend.set("bench:c", b"stale", 60, tags, versions)
+    value, _ = await backend.get("bench:c", tags)
+    expect(value is None, "a value read before an invalidation is not served")
+
+    _, versions = await backend.get("bench:e", ["user:4"])
+    await backend.invalidate(["user:5"])
+    await backend.set("bench:e", b"unrelated", 60, ["user:4"], versions)
+    value, _ = await backend.get("bench:e", ["user:4"])
+    expect(
+        value == b"unrelated",
+        "another user's invalidation does not block storing a value",
+    )
+
+    _, versions = await backend.get("bench:d", ["user:3"])
+    await backend.set("bench:d", b"short", 0.05, ["user:3"], versions)
+    await asyncio.sleep(0.1)
+    value, _ = await backend.get("bench:d", ["user:3"])
+    expect(value is None, "an entry expires after its TTL")
+    return failures
+
+
+async def time_lookups(backend, runs: int) -> List[float]:
+    tags = ["user:9", "user:9:challenges"]
+    _, versions = await backend.get("bench:timed", tags)
+    await backend.set("bench:timed", b"x" * 4096, 60, tags, versions)
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        value, _ = await backend.get("bench:timed", tags)
+        latencies.append(time.perf_counter() - started)
+        assert value is not None
+    return latencies
+
+
+async def run(url: Optional[str], runs: int) -> bool:
+    from app import cache
+
+    server = None
+    if url is None:
+        server = StandInServer()
+        url = await server.start()
+    backends: Dict[str, Callable] = {
+        "memory": lambda: cache.MemoryBackend(1024 * 1024, 3600),
+        "redis": lambda: cache.RedisBackend(url, 4, 1.0, 3600),
+    }
+    passed = True
+    try:
+        for name, factory in backends.items():
+            failures = await check(factory())
+            for failure in failures:
+                print(f"{name:7} FAILED {failure}")
+            passed = passed and not failures
+            latencies = await time_lookups(factory(), runs)
+            print(
+                f"{name:7} {'ok' if not failures else 'failed':6} "
+                f"lookup median {statistics.median(latencies) * 1e6:8.1f} µs  "
+                f"max {max(latencies) * 1e6:8.1f} µs"
+            )
+
+        # A server that cannot be reached makes lookups fail, not hang
+        unreachable = cache.RedisBackend("redis://127.0.0.1:1/0", 1, 0.2, 3600)
+        try:
+            await unreachable.get("bench:a", ["user:1"])
+            print("redis   FAILED an unreachable server raises CacheError")
+            passed = False
+        except cache.CacheError:
+            pass
+    finally:
+        if server is not None:
+            await server.stop()
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--url", default=None, help="Redis server to use instead of the stand-in"
+    )
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    if not asyncio.run(run(args.url, args.runs)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Time `GET /api/v1/challenges/all_challenges` with and without the per-user
+challenge list cache, stored in the configured CACHE_BACKEND.
+
+Creates one user with `--challenges` challenges, then times `--runs` requests
+for the first page with the cache disabled, and again with it enabled (the
+first of those requests filling the cache).
+
+Usage:
+    python -m benchmarks.challenge_list_cache [--challenges 100] [--runs 500]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+
+async def time_requests(client, headers: Dict[str, str], runs: int) -> List[float]:
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = await client.get(
+            "/api/v1/challenges/all_challenges", headers=headers
+        )
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+async def run(challenges: int, runs: int) -> Dict[str, List[float]]:
+    from app import cache
+    from benchmarks import common
+
+    common.create_schema()
+    async with common.client() as client:
+        headers = await common.register_and_login(client, "lister")
+        for index in range(challenges):
+            await client.post(
+                "/api/v1/challenges/",
+                json={"name": f"Challenge {index}", "description": "x" * 100},
+                headers=headers,
+            )
+
+        backend, cache.backend = cache.backend, cache.NullBackend()
+        results = {"no cache": await time_requests(client, headers, runs)}
+        cache.backend = backend
+        results["cache"] = await time_requests(client, headers, runs)
+    stats = cache.challenge_list_cache.stats()
+    print(
+        f"cache hits {stats['hits']}  misses {stats['misses']}  "
+        f"hit ratio {stats['hit_ratio']:.3f}  {cache.backend.stats()}"
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--challenges", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    results = asyncio.run(run(args.challenges, args.runs))
+    for name, latencies in results.items():
+        print(
+            f"{name:9} median {statistics.median(latencies) * 1000:7.2f} ms  "
+            f"max {max(latencies) * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the size and encode time of a challenge's daily logs sent as one object
+per log and with `format=columnar`.
+
+Builds `--days` days of logs in memory, every day logged but one in `--gap-every`
+and one in three not completed, then times `--runs` encodings of each format:
+`DailyLog` objects for `objects`, and rows of the columns the route selects for
+`columnar`.
+
+Usage:
+    python -m benchmarks.columnar_logs [--days 365] [--gap-every 30] [--runs 200]
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from collections import namedtuple
+from typing import List
+
+
+def make_logs(days: int, gap_every: int) -> List:
+    from app import database
+
+    start = datetime(2020, 1, 1)
+    return [
+        database.DailyLog(
+            id=day + 1,
+            challenge_id=1,
+            log_date=start + timedelta(days=day),
+            completed=day % 3 != 0,
+        )
+        for day in range(days)
+        if day % gap_every != gap_every - 1
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--gap-every", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    from app import schemas
+    from app.serialization import FastJSONResponse, RowSerializer, columnar_logs
+
+    logs = make_logs(args.days, args.gap_every)
+    LogRow = namedtuple("LogRow", ["id", "log_date", "completed"])
+    rows = [LogRow(log.id, log.log_date, log.completed) for log in logs]
+    serializer = RowSerializer(schemas.DailyLogResponse)
+    formats = {
+        "objects": lambda: serializer.dump_json(logs),
+        "columnar": lambda: FastJSONResponse(columnar_logs(1, rows)).body,
+    }
+    for name, encode in formats.items():
+        latencies = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            body = encode()
+            latencies.append(time.perf_counter() - started)
+        print(
+            f"{name:9} {len(body):8d} bytes  "
+            f"median {statistics.median(latencies) * 1000:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
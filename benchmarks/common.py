@@ -0,0 +1,100 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Statements `count_statements` leaves out
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def use_sqlite_database() -> str:
+    """
+    Point the app at a fresh SQLite file. Must run before `app` is imported,
+    since settings are read at import time.
+
+    Returns:
+        str: The SQLite database URL in use.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def create_schema() -> None:
+    """
+    Bring the configured database up to the latest schema version.
+    """
+    from app import database, migrations
+
+    migrations.upgrade(database.engine)
+
+
+def client():
+    """
+    Build an HTTP client that talks to the app in-process over ASGI.
+
+    Returns:
+        httpx.AsyncClient: Client bound to `app.main.app`.
+    """
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+async def register_and_login(client, username: str) -> Dict[str, str]:
+    """
+    Create a user and log them in.
+
+    Args:
+        client (httpx.AsyncClient): Client returned by `client()`.
+        username (str): Username to register.
+
+    Returns:
+        Dict[str, str]: Authorization headers carrying the user's token.
+    """
+    password = f"{username}-password"
+    await client.post(
+        "/api/v1/users/",
+        json={
+            "username": username,
+            "password": password,
+            "email": f"{username}@example.com",
+        },
+    )
+    response = await client.post(
+        "/api/v1/users/token", json={"username": username, "password": password}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@contextmanager
+def count_statements() -> Iterator[List[str]]:
+    """
+    Record the SQL statements executed by the engine serving requests.
+
+    Yields:
+        List[str]: Grows with each statement executed inside the block.
+    """
+    from sqlalchemy import event
+
+    from app import database
+
+    engine = (
+        database.async_engine.sync_engine
+        if database.async_engine is not None
+        else database.engine
+    )
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(TRANSACTION_CONTROL):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
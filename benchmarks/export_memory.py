@@ -0,0 +1,166 @@
+"""
+Check that `GET /api/v1/users/export` streams a user's history in constant
+memory.
+
+Seeds one user with `--logs` daily logs spread over `--challenges` challenges,
+then exports them, sampling the process RSS after each chunk sent. Fails if the
+RSS grows by more than `--budget-mb` over its level before the export.
+
+The app is driven directly over ASGI rather than through `httpx`, whose ASGI
+transport buffers the whole response.
+
+Usage:
+    python -m benchmarks.export_memory [--logs 1000000] [--challenges 1000]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+
+def rss_bytes() -> int:
+    """
+    Resident set size of this process (Linux only).
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def seed(user_id: int, logs: int, challenges: int) -> None:
+    """
+    Insert `challenges` challenges for the user, and `logs` daily logs spread
+    evenly over them, in batches so that seeding itself stays small.
+    """
+    from app import database
+
+    now = database.timestamp_now()
+    start = datetime(2000, 1, 1)
+    per_challenge = -(-logs // challenges)
+    with database.engine.begin() as connection:
+        connection.execute(
+            database.Challenge.__table__.insert(),
+            [
+                {
+                    "id": challenge_id,
+                    "user_id": user_id,
+                    "name": f"Challenge {challenge_id}",
+                    "description": "x" * 100,
+                    "started_at": now,
+                }
+                for challenge_id in range(1, challenges + 1)
+            ],
+        )
+    for first in range(0, logs, 10000):
+        with database.engine.begin() as connection:
+            connection.execute(
+                database.DailyLog.__table__.insert(),
+                [
+                    {
+                        "challenge_id": 1 + index // per_challenge,
+                        "log_date": start + timedelta(days=index % per_challenge),
+                        "completed": index % 3 != 0,
+                        "created_at": now,
+                    }
+                    for index in range(first, min(first + 10000, logs))
+                ],
+            )
+
+
+async def export(headers: Dict[str, str]) -> Dict[str, float]:
+    """
+    Run one export request against the app, counting its lines and sampling the
+    RSS after each chunk.
+    """
+    from app.main import app
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/v1/users/export",
+        "raw_path": b"/api/v1/users/export",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in {**headers, "Host": "bench"}.items()
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    requested = False
+    stats = {"status": 0, "lines": 0, "bytes": 0, "peak_rss": rss_bytes()}
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            stats["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            stats["lines"] += body.count(b"\n")
+            stats["bytes"] += len(body)
+            stats["peak_rss"] = max(stats["peak_rss"], rss_bytes())
+
+    await app(scope, receive, send)
+    return stats
+
+
+async def run(logs: int, challenges: int) -> Dict[str, float]:
+    from benchmarks import common
+
+    common.create_schema()
+    async with common.client() as client:
+        headers = await common.register_and_login(client, "exporter")
+    seed(1, logs, challenges)
+
+    gc.collect()
+    baseline = rss_bytes()
+    started = time.perf_counter()
+    stats = await export(headers)
+    stats["seconds"] = time.perf_counter() - started
+    stats["growth_mb"] = (stats["peak_rss"] - baseline) / 2**20
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logs", type=int, default=1000000)
+    parser.add_argument("--challenges", type=int, default=1000)
+    parser.add_argument("--budget-mb", type=float, default=64)
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    stats = asyncio.run(run(args.logs, args.challenges))
+
+    expected = args.logs + args.challenges
+    print(
+        f"status {stats['status']}  {stats['lines']} lines  "
+        f"{stats['bytes'] / 2**20:.1f} MB in {stats['seconds']:.1f} s  "
+        f"RSS growth {stats['growth_mb']:.1f} MB (budget {args.budget_mb:.0f} MB)"
+    )
+    ok = (
+        stats["status"] == 200
+        and stats["lines"] == expected
+        and stats["growth_mb"] <= args.budget_mb
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Time the encoding of list responses with FastAPI's response model path and with
+the `RowSerializer` fast path.
+
+Builds `DailyLog` and `Challenge` rows in memory, then for each row count in
+`--rows` times `--runs` encodings of the whole list with each path:
+
+- `response_model`: what FastAPI does for `response_model=List[...]`, validating
+  every row from its attributes, turning the models into plain data with
+  `jsonable_encoder` and dumping it with the stdlib `json` encoder.
+- `fast_path`: `RowSerializer.dump_json`, as the list routes now return.
+
+Both must produce the same JSON.
+
+Usage:
+    python -m benchmarks.list_serialization [--rows 100 1000 10000] [--runs 20]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Sequence
+
+
+def make_rows(rows: int) -> Dict[str, List]:
+    """
+    Build `rows` daily logs and `rows` challenges, not attached to any session.
+    """
+    from app import database
+
+    now = database.timestamp_now()
+    # Days are stored as midnight timestamps
+    start = datetime(2020, 1, 1)
+    return {
+        "daily logs": [
+            database.DailyLog(
+                id=index,
+                challenge_id=1,
+                log_date=start + timedelta(days=index),
+                completed=index % 3 != 0,
+            )
+            for index in range(1, rows + 1)
+        ],
+        "challenges": [
+            database.Challenge(
+                id=index,
+                user_id=1,
+                name=f"Challenge {index}",
+                description="x" * 100,
+                started_at=now,
+                completed_at=None,
+            )
+            for index in range(1, rows + 1)
+        ],
+    }
+
+
+def response_model_path(model) -> Callable[[Sequence], bytes]:
+    """
+    Encode like FastAPI's `serialize_response` followed by `JSONResponse`.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(List[model])
+
+    def encode(rows: Sequence) -> bytes:
+        content = jsonable_encoder(adapter.validate_python(rows, from_attributes=True))
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    return encode
+
+
+def time_encoding(encode: Callable[[Sequence], bytes], rows: Sequence, runs: int):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = encode(rows)
+        latencies.append(time.perf_counter() - started)
+    return body, statistics.median(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    from app import schemas
+    from app.serialization import RowSerializer
+
+    models = {
+        "daily logs": schemas.DailyLogResponse,
+        "challenges": schemas.ChallengeResponse,
+    }
+    for rows in args.rows:
+        for kind, objects in make_rows(rows).items():
+            slow_body, slow = time_encoding(
+                response_model_path(models[kind]), objects, args.runs
+            )
+            fast_body, fast = time_encoding(
+                RowSerializer(models[kind]).dump_json, objects, args.runs
+            )
+            assert json.loads(slow_body) == json.loads(fast_body)
+            print(
+                f"{rows:6d} {kind:11} response_model {slow * 1000:8.2f} ms  "
+                f"fast_path {fast * 1000:8.2f} ms  x{slow / fast:5.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
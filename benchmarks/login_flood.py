@@ -0,0 +1,191 @@
+"""
+Measure legitimate login latency while `POST /api/v1/users/token` is flooded.
+
+A flood of `--rate` wrong-password attempts per second against existing
+accounts, sent from a few client IPs, runs alongside a legitimate user logging
+in from their own IP. The legitimate latency is measured without a flood, then
+under the flood with login admission control disabled and enabled, each time
+after the flooders have spent their initial bursts and the hashes those bursts
+queued have run.
+
+Fails if a legitimate login is refused, or if the median legitimate latency
+under the flood with admission control exceeds `--max-slowdown` times the
+median without a flood.
+
+Usage:
+    python -m benchmarks.login_flood [--logins 8] [--rate 200] [--max-slowdown 4]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+
+def client(ip: str):
+    import httpx
+
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app, client=(ip, 40000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+async def flood(ip: str, stop: asyncio.Event, victims: int, pause: float) -> None:
+    async with client(ip) as attacker:
+        attempt = 0
+        while not stop.is_set():
+            attempt += 1
+            await attacker.post(
+                "/api/v1/users/token",
+                json={
+                    "username": f"victim{attempt % victims}",
+                    "password": "wrong-guess",
+                },
+            )
+            await asyncio.sleep(pause)
+
+
+async def legitimate_logins(username: str, ip: str, logins: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    failures = 0
+    async with client(ip) as legitimate:
+        for _ in range(logins):
+            started = time.perf_counter()
+            response = await legitimate.post(
+                "/api/v1/users/token",
+                json={"username": username, "password": f"{username}-password"},
+            )
+            latencies.append(time.perf_counter() - started)
+            failures += response.status_code != 200
+            await asyncio.sleep(0.05)
+    latencies.sort()
+    return {
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "failed": failures,
+    }
+
+
+async def phase(
+    username: str,
+    ip: str,
+    logins: int,
+    flooders: int,
+    ips: int,
+    victims: int,
+    rate: float,
+    warmup: float = 2.0,
+    drain_timeout: float = 30.0,
+) -> Dict[str, float]:
+    from app.hashing import password_hasher
+
+    stop = asyncio.Event()
+    tasks = [
+        asyncio.create_task(
+            flood(f"10.1.0.{index % ips + 1}", stop, victims, flooders / rate)
+        )
+        for index in range(flooders)
+    ]
+    try:
+        # Measure the steady state, once the flooders have spent their bursts and
+        # the hashes admitted by them have run
+        if flooders:
+            await asyncio.sleep(warmup)
+            deadline = time.monotonic() + drain_timeout
+            while (
+                password_hasher.stats()["queued"] and time.monotonic() < deadline
+            ):
+                await asyncio.sleep(0.1)
+        return await legitimate_logins(username, ip, logins)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks)
+
+
+async def run(
+    logins: int, flooders: int, ips: int, victims: int, rate: float
+) -> Dict[str, Dict]:
+    from app import ratelimit
+    from benchmarks import common
+
+    common.create_schema()
+    async with common.client() as setup:
+        for name in ["quiet", "unprotected", "protected"]:
+            await common.register_and_login(setup, name)
+        for index in range(victims):
+            await common.register_and_login(setup, f"victim{index}")
+
+    limiters = ratelimit.login_limiters
+    unlimited = tuple(
+        ratelimit.RateLimiter(limiter.name, 0, float("inf"), 1, 1)
+        for limiter in limiters
+    )
+
+    results = {
+        "no flood": await phase("quiet", "10.0.0.1", logins, 0, ips, victims, rate)
+    }
+    ratelimit.login_limiters = unlimited
+    results["flood, no admission control"] = await phase(
+        "unprotected", "10.0.0.2", logins, flooders, ips, victims, rate
+    )
+    ratelimit.login_limiters = limiters
+    results["flood, admission control"] = await phase(
+        "protected", "10.0.0.3", logins, flooders, ips, victims, rate
+    )
+    results["counters"] = {limiter.name: limiter.stats() for limiter in limiters}
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    # Stays within the per-username burst, the legitimate user is never limited
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--flooders", type=int, default=50)
+    parser.add_argument("--ips", type=int, default=5)
+    parser.add_argument("--victims", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=200, help="flood attempts per second, in total"
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=4,
+        help="most the flood may multiply the median latency with admission control",
+    )
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    # A realistic cost makes every unchecked attempt expensive
+    os.environ.setdefault("BCRYPT_ROUNDS", "10")
+    results = asyncio.run(
+        run(args.logins, args.flooders, args.ips, args.victims, args.rate)
+    )
+
+    counters = results.pop("counters")
+    for name, result in results.items():
+        print(
+            f"{name:28} median {result['median_ms']:8.1f} ms  "
+            f"p95 {result['p95_ms']:8.1f} ms  failed {result['failed']}"
+        )
+    for name, stats in counters.items():
+        print(f"{name:28} allowed {stats['allowed']}  rejected {stats['rejected']}")
+
+    slowdown = (
+        results["flood, admission control"]["median_ms"]
+        / results["no flood"]["median_ms"]
+    )
+    print(f"slowdown with admission control x{slowdown:.1f} (max x{args.max_slowdown})")
+    ok = slowdown <= args.max_slowdown and not any(
+        result["failed"] for result in results.values()
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
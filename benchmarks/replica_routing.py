@@ -0,0 +1,80 @@
+"""
+Check read-replica routing with two SQLite files standing in for the primary
+and the replica.
+
+Nothing replicates between the two files, so a read reveals which one served
+it: rows written through the API only exist on the primary. The script writes a
+challenge and checks that the writer's reads stay on the primary for
+READ_YOUR_WRITES_SECONDS, then move to the replica. It also checks a read after
+the process forgot its own marks, as another worker would: the write's mark is
+found in the cache backend the workers share. It exits with status 1 if a read
+was routed to the wrong database.
+
+Usage:
+    python -m benchmarks.replica_routing [--window 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import List
+
+
+async def run(window: float) -> List[str]:
+    from app import database, migrations
+    from benchmarks import common
+
+    common.create_schema()
+    for replica in database.replicas:
+        migrations.upgrade(replica.engine)
+
+    failures = []
+    # A distinct page size per read, so that no cached page answers it
+    limits = iter(range(10, 100))
+
+    async def expect(headers: dict, visible: bool, label: str) -> None:
+        response = await client.get(
+            "/api/v1/challenges/all_challenges",
+            params={"limit": next(limits)},
+            headers=headers,
+        )
+        served_by = "primary" if response.json() else "replica"
+        print(f"{label:40} served by {served_by}")
+        if (served_by == "primary") != visible:
+            failures.append(label)
+
+    async with common.client() as client:
+        writer = await common.register_and_login(client, "writer")
+        await client.post(
+            "/api/v1/challenges/", json={"name": "Replicated"}, headers=writer
+        )
+        await expect(writer, True, "read right after a write")
+        database.recent_writers._until.clear()
+        await expect(writer, True, "read by another worker after a write")
+        await asyncio.sleep(window * 1.5)
+        await expect(writer, False, "read after the stickiness window")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--window", type=float, default=0.5, help="seconds")
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    primary_url = common.use_sqlite_database()
+    replica_url = primary_url.replace("bench.db", "replica.db")
+    os.environ["DATABASE_REPLICA_URLS"] = json.dumps([replica_url])
+    os.environ["READ_YOUR_WRITES_SECONDS"] = str(args.window)
+    # Holds the marks of recent writers, as Redis would for several workers
+    os.environ["CACHE_BACKEND"] = "memory"
+
+    failures = asyncio.run(run(args.window))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Compare the shared-challenges inbox (`GET /api/v1/shared-challenges/user`)
+before and after its query became a single joined projection.
+
+Seeds `--shares` shares for one recipient, spread over challenges of `--owners`
+different users, then times `--runs` requests with each implementation:
+
+- `orm`: the previous code path, loading `SharedChallenge` objects with their
+  challenge and lazy-loading each owner to copy fields into the response.
+- `projection`: the current `crud.list_shared_with`.
+
+The projection must issue two statements whatever the number of shares: the
+version probe answering conditional requests, and the projection itself.
+
+Usage:
+    python -m benchmarks.shared_inbox [--shares 10000] [--owners 1000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+
+def seed(shares: int, owners: int) -> None:
+    """
+    Insert `owners` users with one challenge each, and `shares` shares of those
+    challenges with the recipient (user 1).
+    """
+    from app import database
+
+    now = database.timestamp_now()
+    with database.engine.begin() as connection:
+        connection.execute(
+            database.User.__table__.insert(),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "password_hash": "-",
+                    "created_at": now,
+                    "is_active": True,
+                }
+                for user_id in range(2, owners + 2)
+            ],
+        )
+        connection.execute(
+            database.Challenge.__table__.insert(),
+            [
+                {
+                    "id": owner_id,
+                    "user_id": owner_id,
+                    "name": "shared",
+                    "description": "A challenge shared with the inbox owner",
+                    "started_at": now,
+                }
+                for owner_id in range(2, owners + 2)
+            ],
+        )
+        connection.execute(
+            database.SharedChallenge.__table__.insert(),
+            [
+                {
+                    "challenge_id": 2 + index % owners,
+                    "shared_user_id": 1,
+                    "shared_at": now,
+                }
+                for index in range(shares)
+            ],
+        )
+
+
+async def orm_list_shared_with(db, user_id: int, fields=None) -> List:
+    """
+    The inbox query as it was: shares and challenges loaded as ORM objects, the
+    owner of each challenge lazy-loaded while building the response.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+    from starlette.concurrency import run_in_threadpool
+
+    from app import database, schemas
+
+    def load(session) -> List:
+        shared_challenges = session.scalars(
+            select(database.SharedChallenge)
+            .options(joinedload(database.SharedChallenge.challenge))
+            .where(database.SharedChallenge.shared_user_id == user_id)
+        ).all()
+        return [
+            schemas.SharedChallengeResponse(
+                id=shared_challenge.id,
+                challenge_id=shared_challenge.challenge.id,
+                name=shared_challenge.challenge.name,
+                description=shared_challenge.challenge.description,
+                started_at=shared_challenge.challenge.started_at,
+                completed_at=shared_challenge.challenge.completed_at,
+                shared_at=shared_challenge.shared_at,
+                shared_by=shared_challenge.challenge.user.username,
+            )
+            for shared_challenge in shared_challenges
+        ]
+
+    return await run_in_threadpool(load, db.sync_session)
+
+
+async def run(shares: int, owners: int, runs: int) -> Dict[str, Dict[str, float]]:
+    from app import crud
+    from benchmarks import common
+
+    common.create_schema()
+    results: Dict[str, Dict[str, float]] = {}
+    async with common.client() as client:
+        headers = await common.register_and_login(client, "inbox")
+        seed(shares, owners)
+
+        implementations = {
+            "orm": orm_list_shared_with,
+            "projection": crud.list_shared_with,
+        }
+        projection = crud.list_shared_with
+        for name, implementation in implementations.items():
+            crud.list_shared_with = implementation
+            try:
+                latencies = []
+                for _ in range(runs):
+                    with common.count_statements() as statements:
+                        started = time.perf_counter()
+                        response = await client.get(
+                            "/api/v1/shared-challenges/user", headers=headers
+                        )
+                        latencies.append(time.perf_counter() - started)
+                    response.raise_for_status()
+                    assert len(response.json()) == shares
+            finally:
+                crud.list_shared_with = projection
+            results[name] = {
+                "statements": len(statements),
+                "median_ms": statistics.median(latencies) * 1000,
+            }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shares", type=int, default=10000)
+    parser.add_argument("--owners", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    # The ORM variant lazy-loads, which only a sync session can do
+    os.environ["DATABASE_ASYNC"] = "false"
+    results = asyncio.run(run(args.shares, args.owners, args.runs))
+
+    for name, result in results.items():
+        print(
+            f"{name:10} {result['statements']:6d} statements "
+            f"{result['median_ms']:9.1f} ms median"
+        )
+    sys.exit(0 if results["projection"]["statements"] == 2 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare request throughput of the sync and async database modes.
+
+Each mode runs in its own interpreter because DATABASE_ASYNC is read at import
+time. Every run seeds one user with a few challenges and then fires
+`--requests` authenticated reads with `--concurrency` in flight.
+
+SQLite answers in microseconds, so the threadpool never saturates and the sync
+mode usually wins locally; pass `--database-url` pointing at an empty MySQL
+database to measure the mode switch against real network round trips.
+
+Usage:
+    python -m benchmarks.sync_vs_async [--requests 2000] [--concurrency 100]
+        [--database-url mysql+pymysql://...]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+
+async def run_mode(total: int, concurrency: int) -> float:
+    from benchmarks import common
+
+    common.create_schema()
+    async with common.client() as client:
+        headers = await common.register_and_login(client, f"bench{os.getpid()}")
+        for index in range(20):
+            await client.post(
+                "/api/v1/challenges/",
+                json={"name": f"challenge {index}"},
+                headers=headers,
+            )
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one_request() -> None:
+            async with semaphore:
+                response = await client.get(
+                    "/api/v1/challenges/all_challenges", headers=headers
+                )
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        return total / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--database-url")
+    parser.add_argument("--mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        from benchmarks import common
+
+        os.environ["DATABASE_ASYNC"] = str(args.mode == "async")
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        else:
+            common.use_sqlite_database()
+        throughput = asyncio.run(run_mode(args.requests, args.concurrency))
+        print(f"{args.mode:>5}: {throughput:8.1f} req/s")
+        return
+
+    for mode in ("sync", "async"):
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.sync_vs_async",
+                "--mode",
+                mode,
+                "--requests",
+                str(args.requests),
+                "--concurrency",
+                str(args.concurrency),
+                *(["--database-url", args.database_url] if args.database_url else []),
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Count the SQL statements issued by each write endpoint.
+
+Every write should cost its own statements only: the written row is returned
+from the session (or `RETURNING`) instead of being reloaded after the commit.
+Exits with status 1 if an endpoint issues more statements than its budget.
+
+Usage:
+    python -m benchmarks.write_queries
+"""
+
+import asyncio
+import sys
+from typing import Dict
+
+# Statements each endpoint may issue, transaction control excluded. `token` and
+# `verify_token` do not touch the database, so authenticated calls cost nothing extra.
+BUDGETS = {
+    # existence check + INSERT
+    "create_user": 2,
+    # INSERT
+    "create_challenge": 1,
+    # ownership check + INSERT ... RETURNING (or INSERT on MySQL)
+    "create_daily_log": 2,
+    # owner-scoped UPDATE ... RETURNING
+    "update_daily_log": 1,
+    # owned challenge + recipient lookup, INSERT
+    "share_challenge": 2,
+}
+
+
+async def run() -> Dict[str, int]:
+    from benchmarks import common
+
+    common.create_schema()
+    counts: Dict[str, int] = {}
+    async with common.client() as client:
+        headers = await common.register_and_login(client, "writer")
+        reader_headers = await common.register_and_login(client, "reader")
+        reader = (
+            await client.get("/api/v1/users/profile", headers=reader_headers)
+        ).json()
+
+        async def measure(name: str, method: str, url: str, payload: dict) -> dict:
+            with common.count_statements() as statements:
+                response = await client.request(
+                    method, url, json=payload, headers=headers
+                )
+            response.raise_for_status()
+            counts[name] = len(statements)
+            return response.json()
+
+        await measure(
+            "create_user",
+            "POST",
+            "/api/v1/users/",
+            {"username": "new", "password": "password", "email": "new@example.com"},
+        )
+        challenge = await measure(
+            "create_challenge", "POST", "/api/v1/challenges/", {"name": "Read"}
+        )
+        log = await measure(
+            "create_daily_log",
+            "POST",
+            "/api/v1/daily-logs/",
+            {
+                "challenge_id": challenge["id"],
+                "log_date": "2024-01-01",
+                "completed": False,
+            },
+        )
+        await measure(
+            "update_daily_log",
+            "PUT",
+            f"/api/v1/daily-logs/{log['id']}",
+            {"completed": True},
+        )
+        await measure(
+            "share_challenge",
+            "POST",
+            "/api/v1/shared-challenges/",
+            {"challenge_id": challenge["id"], "shared_user_id": reader["id"]},
+        )
+    return counts
+
+
+def main() -> None:
+    from benchmarks import common
+
+    common.use_sqlite_database()
+    counts = asyncio.run(run())
+
+    failed = False
+    for name, budget in BUDGETS.items():
+        over = counts[name] > budget
+        failed = failed or over
+        print(
+            f"{name:18} {counts[name]} statements (budget {budget})"
+            + ("  OVER BUDGET" if over else "")
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()